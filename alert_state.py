@@ -0,0 +1,152 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from subscription_store import (COLUMNS, CONDITION_EXPRESSION, CONDITION_GTE, CONDITION_LTE, Subscription,
+                                shard_clause)
+
+# 狀態：armed 等待穿越、fired 已通知、cooldown 已回落但仍在冷卻期內
+ARMED = "armed"
+FIRED = "fired"
+COOLDOWN = "cooldown"
+
+DEFAULT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "0.05"))
+DEFAULT_COOLDOWN = timedelta(hours=float(os.getenv("ALERT_COOLDOWN_HOURS", "24")))
+
+
+class AlertStateMachine:
+    """
+    邊緣觸發的通知狀態機，狀態存在訂閱資料庫中。
+    armed 的規則在條件達成時通知並轉為 fired；利率需回落超過 hysteresis
+    才會重新 armed（若離上次通知未滿 cooldown 則先進入 cooldown）。
+    每一步都是 (series_id, condition, state, target_rate) 索引上的範圍查詢，
+    只會讀寫當天狀態可能改變的規則。指定 shard=(i, N) 時只處理該分片的訂閱者。
+    """
+
+    def __init__(self, store, hysteresis=DEFAULT_HYSTERESIS, cooldown=DEFAULT_COOLDOWN, shard=None):
+        self.store = store
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.shard = shard
+
+    def advance(self, series_id, current_rate, now=None, outbox=None):
+        """
+        以最新利率推進狀態，回傳這次應該通知的規則。傳入 outbox 時在同一個交易內
+        把通知排入佇列，狀態改變與通知不會因中斷而只完成一半。
+        """
+        now = (now or datetime.now()).isoformat()
+        cooldown_until = (datetime.fromisoformat(now) + self.cooldown).isoformat()
+        in_shard = shard_clause(self.shard)
+        with self.store.connect() as conn:
+            # 先取得寫入鎖，讓查詢與更新看到同一份狀態
+            conn.execute("BEGIN IMMEDIATE")
+            # 冷卻期結束的規則重新 armed
+            expired = conn.execute(
+                "UPDATE subscriptions SET state = ? WHERE state = ? AND cooldown_until <= ?" + in_shard,
+                (ARMED, COOLDOWN, now)
+            ).rowcount
+
+            # 已通知且利率回落超過 hysteresis 的規則解除 fired
+            rearmed = 0
+            for condition, clause, bound in (
+                (CONDITION_GTE, "target_rate > ?", current_rate + self.hysteresis),
+                (CONDITION_LTE, "target_rate < ?", current_rate - self.hysteresis),
+            ):
+                rearmed += conn.execute(
+                    "UPDATE subscriptions"
+                    " SET state = CASE WHEN cooldown_until > ? THEN ? ELSE ? END"
+                    f" WHERE series_id = ? AND condition = ? AND state = ? AND {clause}" + in_shard,
+                    (now, COOLDOWN, ARMED, series_id, condition, FIRED, bound)
+                ).rowcount
+
+            # armed 且條件達成的規則：這次要通知
+            fired = []
+            for condition, clause in ((CONDITION_GTE, "target_rate <= ?"),
+                                      (CONDITION_LTE, "target_rate >= ?")):
+                where = f" WHERE series_id = ? AND condition = ? AND state = ? AND {clause}" + in_shard
+                params = (series_id, condition, ARMED, current_rate)
+                rows = conn.execute(
+                    f"SELECT {COLUMNS} FROM subscriptions" + where,
+                    params
+                ).fetchall()
+                fired.extend(Subscription(*row) for row in rows)
+                # 同一個範圍條件一次更新，不逐筆以 id 更新
+                conn.execute(
+                    "UPDATE subscriptions SET state = ?, fired_at = ?, cooldown_until = ?" + where,
+                    (FIRED, now, cooldown_until) + params
+                )
+            if outbox is not None:
+                outbox.enqueue(conn, fired, current_rate, now)
+        logging.info(f"{series_id} 狀態更新: 觸發 {len(fired)}，重新啟用 {rearmed}，冷卻結束 {expired}")
+        return fired
+
+    def advance_expressions(self, values, now=None, outbox=None):
+        """
+        以目前各序列的數值推進規則語法的訂閱，回傳這次應該通知的規則。
+        規則依結構分組（走部分覆蓋索引，只讀 id 與常數），每組以一次 NumPy
+        運算判斷；規則不成立即重新 armed（一般的比較式沒有單一門檻可套用
+        hysteresis），冷卻期同 advance。
+        """
+        # 只有規則語法的訂閱才需要 NumPy 與剖析器，一般規則的執行不必載入
+        import numpy as np
+        import rules
+
+        now = (now or datetime.now()).isoformat()
+        cooldown_until = (datetime.fromisoformat(now) + self.cooldown).isoformat()
+        in_shard = shard_clause(self.shard)
+        where = f" FROM subscriptions WHERE condition = '{CONDITION_EXPRESSION}'" + in_shard
+        with self.store.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute(
+                "UPDATE subscriptions SET state = ? WHERE state = ? AND cooldown_until <= ?" + in_shard,
+                (ARMED, COOLDOWN, now)
+            ).rowcount
+
+            fire_ids, rearm_ids, skipped = [], [], 0
+            shapes = [row[0] for row in conn.execute("SELECT DISTINCT rule_shape" + where)]
+            for shape in shapes:
+                # 缺少任何序列（例如取得失敗）時無從判斷，維持原狀態，不觸發也不重新啟用
+                if any(name not in values for name in rules.compile_shape(shape).variables):
+                    skipped += 1
+                    continue
+                for state, ids in ((ARMED, fire_ids), (FIRED, rearm_ids)):
+                    rows = conn.execute(
+                        "SELECT id, rule_params" + where + " AND state = ? AND rule_shape = ?",
+                        (state, shape)
+                    ).fetchall()
+                    if not rows:
+                        continue
+                    row_ids, params = zip(*rows)
+                    matched = rules.evaluate(shape, params, values)
+                    # armed 且成立的觸發；fired 且已不成立的重新啟用
+                    selected = matched if state == ARMED else ~matched
+                    ids.extend(row_ids[i] for i in np.flatnonzero(selected))
+
+            conn.executemany(
+                "UPDATE subscriptions SET state = ?, fired_at = ?, cooldown_until = ? WHERE id = ?",
+                ((FIRED, now, cooldown_until, row_id) for row_id in fire_ids)
+            )
+            conn.executemany(
+                "UPDATE subscriptions SET state = CASE WHEN cooldown_until > ? THEN ? ELSE ? END WHERE id = ?",
+                ((now, COOLDOWN, ARMED, row_id) for row_id in rearm_ids)
+            )
+            fired = []
+            if fire_ids:
+                rows = conn.execute(
+                    f"SELECT {COLUMNS}, rule_shape" + where + " AND state = ? AND fired_at = ?",
+                    (FIRED, now)
+                ).fetchall()
+                # 通知中的「當前利率」取規則裡第一個序列的數值
+                by_value = {}
+                for row in rows:
+                    subscription = Subscription(*row[:6])
+                    fired.append(subscription)
+                    first = rules.compile_shape(row[6]).variables[0]
+                    by_value.setdefault(values[first], []).append(subscription)
+                if outbox is not None:
+                    for current_value, subscriptions in by_value.items():
+                        outbox.enqueue(conn, subscriptions, current_value, now)
+        if skipped:
+            logging.warning(f"{skipped} 種規則結構缺少序列數值，本次不更新狀態")
+        logging.info(f"規則語法訂閱狀態更新: 觸發 {len(fired)}，重新啟用 {len(rearm_ids)}，冷卻結束 {expired}")
+        return fired
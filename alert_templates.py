@@ -0,0 +1,187 @@
+from html import escape
+from string import Template
+
+from subscription_store import CONDITION_EXPRESSION, CONDITION_GTE, CONDITION_LTE
+
+DEFAULT_LOCALE = "zh"
+LOCALES = {"zh": "中文", "en": "English"}
+
+# 收件人各自不同的部分只留下 SendGrid substitution 標記，其餘內容每組只渲染一次
+RECIPIENT_TOKEN = "-email-"
+
+CONDITION_LABELS = {
+    "zh": {CONDITION_GTE: "大於或等於", CONDITION_LTE: "小於或等於", CONDITION_EXPRESSION: "符合規則"},
+    "en": {CONDITION_GTE: "greater than or equal to", CONDITION_LTE: "less than or equal to",
+           CONDITION_EXPRESSION: "rule matched"},
+}
+
+_SOURCES = {
+    "zh": {
+        "subject": "利率監控通知 - ${series_id} 已達 ${current_rate}%",
+        "text": """您好，
+
+當前利率已達到您設定的條件：
+
+序列：${series_id}
+當前利率：${current_rate}%
+目標利率：${target_rate}%
+條件：${condition}
+
+時間：${time}
+
+此致，
+利率監控系統
+
+此通知寄送至 ${recipient}
+""",
+        "html": """<p>您好，</p>
+<p>當前利率已達到您設定的條件：</p>
+<table>
+<tr><td>序列</td><td><b>${series_id}</b></td></tr>
+<tr><td>當前利率</td><td><b>${current_rate}%</b></td></tr>
+<tr><td>目標利率</td><td>${target_rate}%</td></tr>
+<tr><td>條件</td><td>${condition}</td></tr>
+<tr><td>時間</td><td>${time}</td></tr>
+</table>
+<p>此致，<br>利率監控系統</p>
+<p style="color:#888;font-size:12px">此通知寄送至 ${recipient}</p>
+""",
+    },
+    "en": {
+        "subject": "Rate Alert - ${series_id} reached ${current_rate}%",
+        "text": """Hello,
+
+The rate you are monitoring has met your condition:
+
+Series: ${series_id}
+Current rate: ${current_rate}%
+Target rate: ${target_rate}%
+Condition: ${condition}
+
+Time: ${time}
+
+Regards,
+Interest Rate Monitor
+
+This alert was sent to ${recipient}
+""",
+        "html": """<p>Hello,</p>
+<p>The rate you are monitoring has met your condition:</p>
+<table>
+<tr><td>Series</td><td><b>${series_id}</b></td></tr>
+<tr><td>Current rate</td><td><b>${current_rate}%</b></td></tr>
+<tr><td>Target rate</td><td>${target_rate}%</td></tr>
+<tr><td>Condition</td><td>${condition}</td></tr>
+<tr><td>Time</td><td>${time}</td></tr>
+</table>
+<p>Regards,<br>Interest Rate Monitor</p>
+<p style="color:#888;font-size:12px">This alert was sent to ${recipient}</p>
+""",
+    },
+}
+
+# 同一收件人有多則通知時合併成一封摘要，每則通知一列
+_DIGEST_SOURCES = {
+    "zh": {
+        "subject": "利率監控通知 - ${count} 個條件已達成",
+        "text": """您好，
+
+以下 ${count} 個您設定的條件已達成：
+
+${items}
+此致，
+利率監控系統
+
+此通知寄送至 ${recipient}
+""",
+        "text_item": "${series_id}：當前利率 ${current_rate}%，${condition} ${target_rate}%（${time}）\n",
+        "html": """<p>您好，</p>
+<p>以下 ${count} 個您設定的條件已達成：</p>
+<table>
+<tr><th>序列</th><th>當前利率</th><th>條件</th><th>目標利率</th><th>時間</th></tr>
+${items}</table>
+<p>此致，<br>利率監控系統</p>
+<p style="color:#888;font-size:12px">此通知寄送至 ${recipient}</p>
+""",
+        "html_item": "<tr><td><b>${series_id}</b></td><td><b>${current_rate}%</b></td>"
+                     "<td>${condition}</td><td>${target_rate}%</td><td>${time}</td></tr>\n",
+    },
+    "en": {
+        "subject": "Rate Alert - ${count} conditions met",
+        "text": """Hello,
+
+${count} of the conditions you are monitoring have been met:
+
+${items}
+Regards,
+Interest Rate Monitor
+
+This alert was sent to ${recipient}
+""",
+        "text_item": "${series_id}: current rate ${current_rate}%, ${condition} ${target_rate}% (${time})\n",
+        "html": """<p>Hello,</p>
+<p>${count} of the conditions you are monitoring have been met:</p>
+<table>
+<tr><th>Series</th><th>Current rate</th><th>Condition</th><th>Target rate</th><th>Time</th></tr>
+${items}</table>
+<p>Regards,<br>Interest Rate Monitor</p>
+<p style="color:#888;font-size:12px">This alert was sent to ${recipient}</p>
+""",
+        "html_item": "<tr><td><b>${series_id}</b></td><td><b>${current_rate}%</b></td>"
+                     "<td>${condition}</td><td>${target_rate}%</td><td>${time}</td></tr>\n",
+    },
+}
+
+# 模組載入時就把所有模板編譯好
+TEMPLATES = {
+    locale: {part: Template(source) for part, source in parts.items()}
+    for locale, parts in _SOURCES.items()
+}
+DIGEST_TEMPLATES = {
+    locale: {part: Template(source) for part, source in parts.items()}
+    for locale, parts in _DIGEST_SOURCES.items()
+}
+
+
+def _values(labels, series_id, current_rate, target_rate, condition, time):
+    return {
+        "series_id": series_id,
+        "current_rate": f"{current_rate:.2f}",
+        "target_rate": f"{target_rate:.2f}",
+        "condition": labels.get(condition, condition),
+        "time": time,
+        "recipient": RECIPIENT_TOKEN,
+    }
+
+
+def render_alert(locale, series_id, current_rate, target_rate, condition, time):
+    """渲染一組通知內容，回傳 (subject, text, html)；收件人位置保留 RECIPIENT_TOKEN"""
+    templates = TEMPLATES.get(locale) or TEMPLATES[DEFAULT_LOCALE]
+    labels = CONDITION_LABELS.get(locale) or CONDITION_LABELS[DEFAULT_LOCALE]
+    values = _values(labels, series_id, current_rate, target_rate, condition, time)
+    html_values = {key: escape(str(value)) for key, value in values.items()}
+    return (
+        templates["subject"].substitute(values),
+        templates["text"].substitute(values),
+        templates["html"].substitute(html_values),
+    )
+
+
+def render_digest(locale, alerts):
+    """
+    把同一收件人的多則通知渲染成一封摘要，alerts 為
+    (series_id, current_rate, target_rate, condition, time) 的序列，回傳 (subject, text, html)
+    """
+    templates = DIGEST_TEMPLATES.get(locale) or DIGEST_TEMPLATES[DEFAULT_LOCALE]
+    labels = CONDITION_LABELS.get(locale) or CONDITION_LABELS[DEFAULT_LOCALE]
+    text_items, html_items = [], []
+    for alert in alerts:
+        values = _values(labels, *alert)
+        text_items.append(templates["text_item"].substitute(values))
+        html_items.append(templates["html_item"].substitute({k: escape(str(v)) for k, v in values.items()}))
+    values = {"count": len(alerts), "recipient": RECIPIENT_TOKEN}
+    return (
+        templates["subject"].substitute(values),
+        templates["text"].substitute(values, items="".join(text_items)),
+        templates["html"].substitute(values, items="".join(html_items)),
+    )
@@ -1,40 +1,51 @@
 import streamlit as st
-import json
-import re
-from pathlib import Path
+import io
+import shlex
 from email_sender import send_test_email
+import rate_cache
+from alert_templates import LOCALES
+import altair as alt
+import numpy as np
+import pandas as pd
+from downsample import lttb
+from fred_client import DEFAULT_SERIES
+from history_store import HistoryStore
+from outbox import DIGEST_TIMEZONE
+from subscriber_io import export_records, import_records, is_valid_email, read_records
+from subscription_store import DIGEST_DAILY, DIGEST_HOURLY, DIGEST_IMMEDIATE, SubscriptionStore
 import os
 from dotenv import load_dotenv
-import random
-import string
-from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
 def load_config():
-    config_file = Path("config.json")
-    if config_file.exists():
-        with open(config_file, "r") as f:
-            return json.load(f)
+    # 以最近一次儲存的規則作為表單預設值
+    latest = SubscriptionStore().latest()
+    if latest is not None:
+        return {"email": latest.email, "target_rate": latest.target_rate, "condition": latest.condition}
     return {"email": "", "target_rate": 0.0, "condition": "greater than or equal to"}
 
-def save_config(email, target_rate, condition):
-    config = {
-        "email": email,
-        "target_rate": target_rate,
-        "condition": condition
-    }
-    with open("config.json", "w") as f:
-        json.dump(config, f, indent=4)
+def save_config(email, target_rate, condition, locale="zh", series_id="DGS10"):
+    # 新增一條訂閱規則，不再覆蓋其他訂閱者
+    return SubscriptionStore().add(email, target_rate, condition, series_id=series_id, locale=locale)
 
-def is_valid_email(email):
-    pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    return re.match(pattern, email) is not None
+# 可訂閱的訊號；衍生訊號的格式見 indicators.py
+SIGNALS = {
+    "DGS10": "10-Year Treasury yield",
+    "DGS10:ma50": "10-Year 50-day moving average",
+    "DGS10:ma200": "10-Year 200-day moving average",
+    "DGS10:change": "10-Year day-over-day change",
+    "DGS10:high52w": "10-Year 52-week high",
+    "DGS10:low52w": "10-Year 52-week low",
+    "DGS10-DGS2": "10Y-2Y spread",
+}
 
-# 生成隨機 key
-def random_key(length=10):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+DIGEST_LABELS = {
+    DIGEST_IMMEDIATE: "Immediately",
+    DIGEST_HOURLY: "Hourly digest",
+    DIGEST_DAILY: "Daily digest",
+}
 
 # Page configuration
 st.set_page_config(
@@ -79,30 +90,50 @@ config = load_config()
 col1, col2 = st.columns(2)
 
 with col1:
-    # 使用動態 key 和空初始值
-    email_key = f"email_input_{datetime.now().timestamp()}_{random_key()}"
+    # 固定的 key 讓輸入內容在 rerun 之間保留
     email = st.text_input(
-        "Email Address", 
-        value="",  # 始終使用空字符串作為初始值
-        key=email_key,
+        "Email Address",
+        value="",
+        key="email_input",
         help="Enter your email address to receive notifications"
     )
     
     target_rate = st.number_input(
         "Target Interest Rate (%)", 
         value=float(config["target_rate"]),
-        min_value=0.0,
+        min_value=-100.0,
         max_value=100.0,
         step=0.1
     )
 
 with col2:
+    signal = st.selectbox(
+        "Signal",
+        options=list(SIGNALS),
+        format_func=SIGNALS.get,
+        help="Derived signals are updated once per trading day from FRED history"
+    )
+
     condition = st.selectbox(
         "Alert Condition",
         options=["greater than or equal to", "less than or equal to"],
         index=0 if config["condition"] == "greater than or equal to" else 1
     )
     
+    locale = st.selectbox(
+        "Email Language",
+        options=list(LOCALES),
+        format_func=LOCALES.get
+    )
+
+    digest = st.selectbox(
+        "Email Frequency",
+        options=list(DIGEST_LABELS),
+        format_func=DIGEST_LABELS.get,
+        help="Alerts triggered within the window are combined into one email. Hours are in "
+             f"{DIGEST_TIMEZONE.key} time; the daily scheduled check sends any digest due before its next run."
+    )
+    
     # Test email button
     if st.button("Test Email Configuration"):
         if not email:
@@ -116,6 +147,12 @@ with col2:
                 else:
                     st.error("Failed to send test email. Please check the logs.")
 
+rule = st.text_input(
+    "Custom Rule (optional)",
+    placeholder="DGS10 >= 4.5 and DGS2 < 4",
+    help="Combine series and signals with >=, <=, >, <, and, or, not. Overrides the fields above."
+)
+
 # Save button with validation
 if st.button("Save Configuration"):
     if not email:
@@ -123,40 +160,33 @@ if st.button("Save Configuration"):
     elif not is_valid_email(email):
         st.error("Please enter a valid email address")
     else:
-        save_config(email, target_rate, condition)
-        st.success("Configuration saved successfully! ✅")
+        try:
+            if rule.strip():
+                added = SubscriptionStore().add_expression(email, rule, locale=locale)
+            else:
+                added = save_config(email, target_rate, condition, locale, signal)
+            SubscriptionStore().set_digest(email, digest)
+        except ValueError as e:
+            st.error(f"Invalid rule: {e}")
+            st.stop()
+        if added:
+            st.success("Configuration saved successfully! ✅")
+        else:
+            st.info("This alert is already registered for this email.")
         st.info("You will receive email notifications when your conditions are met.")
 
 # Current rate display
 try:
-    import requests
-    from dotenv import load_dotenv
-    import os
-    
-    load_dotenv()
     fred_api_key = os.getenv('FRED_API_KEY')
     
     if fred_api_key:
-        url = "https://api.stlouisfed.org/fred/series/observations"
-        params = {
-            'series_id': 'DGS10',  # 10-Year Treasury Rate
-            'api_key': fred_api_key,
-            'sort_order': 'desc',
-            'limit': 1,
-            'file_type': 'json'
-        }
-        
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('observations') and len(data['observations']) > 0:
-                value = data['observations'][0]['value']
-                if value != '.':
-                    current_rate = float(value)
-                    st.metric(
-                        label="Current 10-Year Treasury Rate",
-                        value=f"{current_rate:.2f}%"
-                    )
+        # 透過共用快取取得利率，避免每次 rerun 都打一次 FRED
+        current_rate = rate_cache.get_rate()
+        if current_rate is not None:
+            st.metric(
+                label="Current 10-Year Treasury Rate",
+                value=f"{current_rate:.2f}%"
+            )
     else:
         # 顯示一個更友好的訊息，並提供解決方案
         st.info("⚠️ Current rate display is disabled. API key not configured in this environment.")
@@ -167,6 +197,136 @@ try:
 except Exception as e:
     st.info(f"Current rate display is disabled in this environment.")
 
+# Rate history chart
+CHART_POINTS = 800  # 約等於圖表的像素寬度
+HISTORY_RANGES = {"1Y": 365, "5Y": 5 * 365, "10Y": 10 * 365, "Max": None}
+
+@st.cache_data(show_spinner=False)
+def load_history(series_id, range_label, last_date, points=CHART_POINTS):
+    # last_date 只用來讓同步新資料後快取失效
+    dates, values = HistoryStore().read(series_id)
+    days = HISTORY_RANGES[range_label]
+    if days is not None and len(dates):
+        start = np.searchsorted(dates, dates[-1] - np.timedelta64(days, "D"))
+        dates, values = dates[start:], values[start:]
+    valid = ~np.isnan(values)
+    x, y = lttb(dates[valid], values[valid], points)
+    return pd.DataFrame({"date": x, "rate": y, "series": series_id})
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_thresholds(series_id):
+    return SubscriptionStore().thresholds(series_id)
+
+try:
+    history = HistoryStore()
+    available = [s for s in DEFAULT_SERIES if history.last_date(s) is not None]
+    if available:
+        st.subheader("Rate History")
+        hcol1, hcol2 = st.columns([3, 1])
+        with hcol1:
+            selected = st.multiselect(
+                "Series",
+                options=available,
+                default=[s for s in ["DGS10"] if s in available] or available[:1]
+            )
+        with hcol2:
+            range_label = st.selectbox("Range", options=list(HISTORY_RANGES), index=1)
+        if selected:
+            frames = [load_history(s, range_label, str(history.last_date(s))) for s in selected]
+            lines = alt.Chart(pd.concat(frames)).mark_line().encode(
+                x=alt.X("date:T", title=None),
+                y=alt.Y("rate:Q", title="Rate (%)", scale=alt.Scale(zero=False)),
+                color=alt.Color("series:N", title=None)
+            )
+            thresholds = pd.DataFrame(
+                [{"rate": t, "label": f"{s} {c} {t:.2f}% ({n})"}
+                 for s in selected for t, c, n in load_thresholds(s)]
+                + [{"rate": target_rate, "label": f"Your target {target_rate:.2f}%"}]
+            )
+            rules = alt.Chart(thresholds).mark_rule(strokeDash=[4, 4], opacity=0.6).encode(
+                y="rate:Q",
+                tooltip=["label:N"]
+            )
+            st.altair_chart(lines + rules, use_container_width=True)
+except Exception as e:
+    st.info("Rate history is not available in this environment.")
+
+# Subscriber admin：只有設定 ADMIN_PASSWORD 時才顯示
+ADMIN_PAGE_SIZES = [25, 50, 100]
+ADMIN_EXPORT_LIMIT = int(os.getenv("ADMIN_EXPORT_LIMIT", "50000"))
+
+def admin_section():
+    st.subheader("Subscriber Admin")
+    store = SubscriptionStore()
+
+    uploaded = st.file_uploader("Bulk import (CSV or JSONL)", type=["csv", "jsonl"])
+    if uploaded is not None and st.button("Import subscribers"):
+        fmt = "jsonl" if uploaded.name.lower().endswith(".jsonl") else "csv"
+        progress = st.empty()
+        # 上傳的檔案以串流逐批讀取，不會整份轉成 DataFrame
+        stream = io.TextIOWrapper(uploaded, encoding="utf-8", newline="")
+        stats = import_records(
+            store, read_records(stream, fmt),
+            on_progress=lambda s: progress.text(f"Read {s['read']:,} rows, imported {s['imported']:,}")
+        )
+        st.success(f"Imported {stats['imported']:,} of {stats['read']:,} rows "
+                   f"({stats['duplicates']:,} duplicates, {stats['invalid']:,} invalid)")
+
+    fcol1, fcol2, fcol3, fcol4 = st.columns([3, 2, 2, 1])
+    with fcol1:
+        email_prefix = st.text_input("Email starts with", key="admin_email")
+    with fcol2:
+        series_filter = st.text_input("Series / rule", key="admin_series")
+    with fcol3:
+        state_filter = st.selectbox("State", ["", "armed", "fired", "cooldown"], key="admin_state")
+    with fcol4:
+        page_size = st.selectbox("Rows", ADMIN_PAGE_SIZES, key="admin_page_size")
+    filters = {"email": email_prefix or None, "series_id": series_filter or None, "state": state_filter or None}
+
+    # session 裡只保存各頁起點的 id，資料每次依游標向資料庫查詢一頁
+    key = (tuple(filters.items()), page_size)
+    if st.session_state.get("admin_filters") != key:
+        st.session_state.admin_filters = key
+        st.session_state.admin_cursors = [0]
+    cursors = st.session_state.admin_cursors
+    rows = store.search(after_id=cursors[-1], limit=page_size, **filters)
+    total = store.count_matching(**filters)
+
+    st.dataframe(
+        pd.DataFrame(rows, columns=["id", "email", "series_id", "target_rate", "condition",
+                                    "locale", "state", "created_at"]),
+        hide_index=True, use_container_width=True
+    )
+    pcol1, pcol2, pcol3 = st.columns([1, 2, 1])
+    with pcol1:
+        if st.button("◀ Previous", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with pcol2:
+        st.caption(f"Page {len(cursors)} of {max(1, -(-total // page_size)):,} · {total:,} subscriptions")
+    with pcol3:
+        if st.button("Next ▶", disabled=len(rows) < page_size):
+            cursors.append(rows[-1][0])
+            st.rerun()
+
+    # 匯出需要掃過所有符合條件的訂閱，按下按鈕才產生；下載內容會整份留在
+    # Streamlit session，超過上限時改用命令列逐批寫檔
+    if total > ADMIN_EXPORT_LIMIT:
+        options = "".join(f" --{name.replace('_', '-')} {shlex.quote(value)}" for name, value in filters.items() if value)
+        st.caption(f"{total:,} subscriptions exceed the in-browser export limit of {ADMIN_EXPORT_LIMIT:,}. "
+                   f"Export them on the server with `python subscriber_io.py export subscribers.csv{options}`.")
+    elif st.button("Prepare CSV export"):
+        export = io.StringIO()
+        count = export_records(store, export, "csv", **filters)
+        st.download_button(f"Download {count:,} subscriptions", export.getvalue(),
+                           file_name="subscribers.csv", mime="text/csv")
+
+admin_password = os.getenv("ADMIN_PASSWORD")
+if admin_password:
+    with st.expander("🗂 Subscriber Admin"):
+        if st.text_input("Admin password", type="password", key="admin_password") == admin_password:
+            admin_section()
+
 # Help section
 with st.expander("ℹ️ How it works"):
     st.markdown("""
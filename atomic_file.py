@@ -0,0 +1,26 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def atomic_write_text(path, text):
+    """先寫入同目錄暫存檔再 os.replace，讀取端永遠不會看到寫到一半的內容"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data):
+    atomic_write_text(path, json.dumps(data))
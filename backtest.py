@@ -0,0 +1,130 @@
+import argparse
+import logging
+from typing import NamedTuple
+
+import numpy as np
+
+from history_store import HistoryStore
+import log_setup
+from subscription_store import CONDITION_GTE, CONDITIONS, SubscriptionStore
+
+
+class BacktestResult(NamedTuple):
+    targets: np.ndarray          # 每條規則的目標利率
+    is_gte: np.ndarray           # True 表示 "greater than or equal to"
+    first_trigger: np.ndarray    # 第一次達成條件的日期，從未達成為 NaT
+    trigger_days: np.ndarray     # 條件成立的天數（每天重寄時的郵件數）
+    crossings: np.ndarray        # 由未達成變為達成的次數（只在穿越時寄信的郵件數）
+    dates: np.ndarray            # 回測使用的日期
+    daily_emails: np.ndarray     # 每天條件成立的規則數
+
+
+def run_backtest(dates, values, targets, is_gte):
+    """
+    對整段歷史一次評估所有規則。以排序後的利率與累積最大/最小值做
+    np.searchsorted，每條規則只需 O(log T)，不必建立 規則數×天數 的矩陣。
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    values = np.asarray(values, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    is_gte = np.asarray(is_gte, dtype=bool)
+
+    # FRED 的缺失值 (NaN) 當天不評估
+    valid = ~np.isnan(values)
+    dates, values = dates[valid], values[valid]
+    days = len(values)
+
+    first_trigger = np.full(len(targets), np.datetime64("NaT"), dtype="datetime64[D]")
+    trigger_days = np.zeros(len(targets), dtype=np.int64)
+    crossings = np.zeros(len(targets), dtype=np.int64)
+    daily_emails = np.zeros(days, dtype=np.int64)
+    if days == 0 or len(targets) == 0:
+        return BacktestResult(targets, is_gte, first_trigger, trigger_days, crossings, dates, daily_emails)
+
+    sorted_values = np.sort(values)
+    previous = np.concatenate(([np.nan], values[:-1]))
+
+    for gte in (True, False):
+        mask = is_gte == gte
+        t = targets[mask]
+        if gte:
+            # 第一次 value >= t：累積最大值非遞減，可直接二分搜尋
+            first = np.searchsorted(np.maximum.accumulate(values), t, side="left")
+            trigger_days[mask] = days - np.searchsorted(sorted_values, t, side="left")
+            # 穿越：前一天 < t <= 當天，即 t 落在 (前一天, 當天] 區間
+            lo = np.where(np.isnan(previous), -np.inf, previous)
+            hi = values
+        else:
+            first = np.searchsorted(-np.minimum.accumulate(values), -t, side="left")
+            trigger_days[mask] = np.searchsorted(sorted_values, t, side="right")
+            # 穿越：當天 <= t < 前一天，即 t 落在 [當天, 前一天) 區間
+            lo = values
+            hi = np.where(np.isnan(previous), np.inf, previous)
+        rising = lo < hi
+        lo, hi = np.sort(lo[rising]), np.sort(hi[rising])
+        if gte:
+            crossings[mask] = np.searchsorted(lo, t, side="left") - np.searchsorted(hi, t, side="left")
+        else:
+            crossings[mask] = np.searchsorted(lo, t, side="right") - np.searchsorted(hi, t, side="right")
+        hit = first < days
+        first_dates = np.full(len(t), np.datetime64("NaT"), dtype="datetime64[D]")
+        first_dates[hit] = dates[first[hit]]
+        first_trigger[mask] = first_dates
+
+        sorted_t = np.sort(t)
+        if gte:
+            daily_emails += np.searchsorted(sorted_t, values, side="right")
+        else:
+            daily_emails += len(sorted_t) - np.searchsorted(sorted_t, values, side="left")
+
+    return BacktestResult(targets, is_gte, first_trigger, trigger_days, crossings, dates, daily_emails)
+
+
+def load_rules(store, series_id):
+    """從訂閱資料庫讀出指定序列的 (targets, is_gte)"""
+    targets = []
+    is_gte = []
+    for condition in CONDITIONS:
+        for subscription in store.iter_sorted(series_id, condition):
+            targets.append(subscription.target_rate)
+            is_gte.append(condition == CONDITION_GTE)
+    return np.array(targets, dtype=np.float64), np.array(is_gte, dtype=bool)
+
+
+def summarize(result):
+    """回測摘要：觸發比例與兩種寄信策略下的郵件量估計"""
+    rules = len(result.targets)
+    days = len(result.dates)
+    return {
+        "rules": rules,
+        "days": days,
+        "rules_ever_triggered": int((~np.isnat(result.first_trigger)).sum()),
+        "emails_daily_resend": int(result.trigger_days.sum()),
+        "emails_on_crossing": int(result.crossings.sum()),
+        "peak_daily_emails": int(result.daily_emails.max()) if days else 0,
+        "mean_daily_emails": float(result.daily_emails.mean()) if days else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本地歷史資料回測所有訂閱規則")
+    parser.add_argument("--series", default="DGS10")
+    parser.add_argument("--history-dir", default=None)
+    parser.add_argument("--db", default=None)
+    args = parser.parse_args()
+
+    history = HistoryStore(args.history_dir) if args.history_dir else HistoryStore()
+    store = SubscriptionStore(args.db) if args.db else SubscriptionStore()
+    dates, values = history.read(args.series)
+    if len(dates) == 0:
+        logging.error(f"找不到 {args.series} 的歷史資料，請先執行 python history_store.py {args.series}")
+        return
+    targets, is_gte = load_rules(store, args.series)
+    result = run_backtest(dates, values, targets, is_gte)
+    for key, value in summarize(result).items():
+        logging.info(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    log_setup.configure()
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+DEFAULT_POPULATIONS = [1, 1000, 100000, 1000000]
+DEFAULT_RESULTS_PATH = Path(__file__).with_name("benchmark_results.jsonl")
+REGRESSION_THRESHOLD = 0.2  # 比上一版慢 20% 以上時標記
+
+# monitor.py 冷啟動（import 到可以開始工作）的時間預算，超過時 --startup 以非零狀態結束
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "60"))
+# 一般執行（沒有通知要寄、沒有規則語法訂閱）在啟動時不應載入的重量級套件
+STARTUP_FORBIDDEN = ("sendgrid", "email_sender", "requests", "numpy", "yfinance", "streamlit", "asyncio")
+
+
+def _timed(func, timings, key):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
+    return wrapper
+
+
+def run_child(population, fred_latency, fred_error_rate, sendgrid_latency):
+    """在獨立行程內跑一次完整的 monitor.main()，回傳量測結果"""
+    from stand_ins import FredStandIn, SendGridStandIn
+
+    fred = FredStandIn(rate=4.5, latency=fred_latency, error_rate=fred_error_rate).start()
+    sendgrid = SendGridStandIn(latency=sendgrid_latency, keep_payloads=False).start()
+    workdir = tempfile.mkdtemp(prefix="monitor-bench-")
+    os.environ.update({
+        "FRED_API_KEY": "bench",
+        "FRED_BASE_URL": fred.base_url,
+        "SENDGRID_API_KEY": "SG.bench",
+        "SENDGRID_FROM_EMAIL": "bench@example.com",
+        "SENDGRID_API_HOST": sendgrid.url,
+        "SUBSCRIPTIONS_DB": os.path.join(workdir, "subscriptions.db"),
+        "RATE_CACHE_PATH": os.path.join(workdir, "rate_cache.json"),
+        "HISTORY_DIR": os.path.join(workdir, "history"),
+    })
+
+    import alert_state
+    import email_sender
+    import monitor
+    from subscription_store import CONDITIONS, SubscriptionStore
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # 目標利率平均分布在 3%～6%，在 4.5% 時約一半的規則會觸發
+    started = time.perf_counter()
+    store = SubscriptionStore()
+    store.add_many(
+        (f"user{i}@example.com", 3 + (i % 301) / 100, CONDITIONS[i % 2], "DGS10")
+        for i in range(population)
+    )
+    setup_seconds = time.perf_counter() - started
+
+    timings = {}
+    monitor.get_current_rates = _timed(monitor.get_current_rates, timings, "fetch")
+    alert_state.AlertStateMachine.advance = _timed(alert_state.AlertStateMachine.advance, timings, "evaluation")
+    email_sender.EmailSender.send_groups = _timed(email_sender.EmailSender.send_groups, timings, "send")
+
+    started = time.perf_counter()
+    ok = monitor.main()
+    total_seconds = time.perf_counter() - started
+
+    emails = sendgrid.recipient_count
+    fred.stop()
+    sendgrid.stop()
+    return {
+        "population": population,
+        "ok": ok,
+        "setup_seconds": round(setup_seconds, 4),
+        "fetch_seconds": round(timings.get("fetch", 0.0), 4),
+        "evaluation_seconds": round(timings.get("evaluation", 0.0), 4),
+        "send_seconds": round(timings.get("send", 0.0), 4),
+        "total_seconds": round(total_seconds, 4),
+        "emails": emails,
+        "emails_per_second": round(emails / timings["send"], 1) if timings.get("send") else 0.0,
+        "fred_requests": fred.request_count,
+        "sendgrid_requests": len(sendgrid.requests),
+        # Linux 上 ru_maxrss 單位為 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def import_times(code):
+    """
+    以 python -X importtime 執行 code，回傳 [(模組, 累計微秒, 巢狀深度)]，只含最上層與
+    其直接依賴；直譯器自己啟動時載入的模組（site 等）不計入
+    """
+    def run(source):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", source], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True
+        )
+        entries, children = [], []
+        for line in completed.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2][1:]
+            depth = (len(name) - len(name.lstrip())) // 2
+            if depth == 1:
+                children.append((name.strip(), int(parts[1]), 1))
+            elif depth == 0:
+                # importtime 先印出子模組，最上層模組在最後
+                entries.append(((name.strip(), int(parts[1]), 0), children))
+                children = []
+        return entries
+
+    baseline = {top[0] for top, _ in run("pass")}
+    return [entry for top, children in run(code) if top[0] not in baseline for entry in [top] + children]
+
+
+def all_imported(code):
+    """code 執行後載入的所有模組名稱"""
+    completed = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        capture_output=True, text=True, cwd=Path(__file__).parent, check=True
+    )
+    return set(completed.stdout.split())
+
+
+def measure_startup(runs=5):
+    """量測 import monitor 的時間，取 runs 次中最快的一次以排除雜訊"""
+    def total(entries):
+        return sum(us for _, us, depth in entries if depth == 0)
+
+    best = min((import_times("import monitor") for _ in range(runs)), key=total)
+    modules = all_imported("import monitor")
+    dependencies = sorted((entry for entry in best if entry[2] == 1), key=lambda entry: -entry[1])
+    return {
+        "kind": "startup",
+        "import_ms": round(total(best) / 1000, 2),
+        "budget_ms": STARTUP_BUDGET_MS,
+        "slowest": [[name, round(us / 1000, 2)] for name, us, _ in dependencies[:5]],
+        "forbidden": sorted(name for name in STARTUP_FORBIDDEN if name in modules),
+    }
+
+
+def run_startup(results_path):
+    """量測並記錄冷啟動時間，回傳是否在預算內且沒有載入不該載入的套件"""
+    previous = [record for record in _read_results(results_path) if record.get("kind") == "startup"]
+    result = measure_startup()
+    record = dict(result, version=git_version(), timestamp=datetime.now().isoformat())
+    with open(results_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    ok = result["import_ms"] <= STARTUP_BUDGET_MS and not result["forbidden"]
+    line = (f"startup import={result['import_ms']:.1f}ms  budget={STARTUP_BUDGET_MS:.0f}ms  "
+            "slowest=" + ", ".join(f"{name} {ms:.1f}ms" for name, ms in result["slowest"]))
+    if previous and previous[-1]["import_ms"] > 0:
+        change = result["import_ms"] / previous[-1]["import_ms"] - 1
+        line += f"  vs {previous[-1]['version']}: {change:+.0%}"
+    if result["import_ms"] > STARTUP_BUDGET_MS:
+        line += "  <-- OVER BUDGET"
+    if result["forbidden"]:
+        line += f"  <-- loads {', '.join(result['forbidden'])}"
+    print(line)
+    return ok
+
+
+def git_version():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _read_results(results_path):
+    if not results_path.exists():
+        return []
+    with open(results_path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def load_previous(results_path):
+    """每個 (人數, 參數) 最後一次的結果，用來比對回歸"""
+    return {(record["population"], record["params"]): record
+            for record in _read_results(results_path) if "population" in record}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本地 FRED/SendGrid 替身離線量測監控流程效能")
+    parser.add_argument("--populations", type=int, nargs="+", default=DEFAULT_POPULATIONS)
+    parser.add_argument("--fred-latency", type=float, default=0.05)
+    parser.add_argument("--fred-error-rate", type=float, default=0.0)
+    parser.add_argument("--sendgrid-latency", type=float, default=0.02)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_PATH)
+    parser.add_argument("--startup", action="store_true",
+                        help=f"只量測 monitor.py 的冷啟動時間（預算 {STARTUP_BUDGET_MS:.0f}ms）")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup:
+        sys.exit(0 if run_startup(args.results) else 1)
+
+    if args.child is not None:
+        result = run_child(args.child, args.fred_latency, args.fred_error_rate, args.sendgrid_latency)
+        print(json.dumps(result))
+        return
+
+    params = f"fred={args.fred_latency}s/{args.fred_error_rate:.0%} sendgrid={args.sendgrid_latency}s"
+    previous = load_previous(args.results)
+    version = git_version()
+    for population in args.populations:
+        # 每個人數在新行程內執行，peak RSS 才不會互相影響
+        completed = subprocess.run(
+            [sys.executable, __file__, "--child", str(population),
+             "--fred-latency", str(args.fred_latency),
+             "--fred-error-rate", str(args.fred_error_rate),
+             "--sendgrid-latency", str(args.sendgrid_latency)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        record = dict(result, version=version, params=params, timestamp=datetime.now().isoformat())
+        with open(args.results, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        line = (f"N={population:>8}  fetch={result['fetch_seconds']:.3f}s  "
+                f"eval={result['evaluation_seconds']:.3f}s  send={result['send_seconds']:.3f}s  "
+                f"emails/s={result['emails_per_second']:>9.1f}  total={result['total_seconds']:.3f}s  "
+                f"rss={result['peak_rss_mb']}MB")
+        before = previous.get((population, params))
+        if before and before["total_seconds"] > 0:
+            change = result["total_seconds"] / before["total_seconds"] - 1
+            flag = "  <-- REGRESSION" if change > REGRESSION_THRESHOLD else ""
+            line += f"  vs {before['version']}: {change:+.0%}{flag}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
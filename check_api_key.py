@@ -1,8 +1,8 @@
 import os
 from dotenv import load_dotenv
-import logging
+import log_setup
 
-logging.basicConfig(level=logging.INFO)
+log_setup.configure()
 
 def check_api_key():
     load_dotenv()
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降採樣：保留視覺上最重要的 threshold 個點，
+    讓幾十年的日資料只以圖表寬度的點數送到瀏覽器。x 需遞增且不含 NaN。
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    # 第一與最後一點固定保留，中間平均分成 threshold - 2 個桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一個桶的平均點作為三角形的第三個頂點
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xf[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        ax, ay = xf[previous], y[previous]
+        area = np.abs((ax - avg_x) * (y[start:end] - ay) - (ax - xf[start:end]) * (avg_y - ay))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return x[selected], y[selected]
@@ -1,22 +1,29 @@
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content
 from dotenv import load_dotenv
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
 import os
 import logging
+import log_setup
+import metrics
 
 # Load environment variables from .env file if present
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# SendGrid allows at most 1000 personalizations per request
+MAX_PERSONALIZATIONS = 1000
+
+# Configure logging (records are written by a background thread)
+log_setup.configure()
 
 class EmailSender:
-    def __init__(self):
+    def __init__(self, host=None):
         self.api_key = os.getenv('SENDGRID_API_KEY')
         self.from_email = os.getenv('SENDGRID_FROM_EMAIL')
+        self.host = host or os.getenv('SENDGRID_API_HOST', 'https://api.sendgrid.com')
+        self._client = None
         
         if not self.api_key:
             logging.error("SendGrid API key not found in environment variables")
@@ -28,14 +35,21 @@ class EmailSender:
             
         logging.info(f"EmailSender initialized with sender: {self.from_email}")
 
+    @property
+    def client(self):
+        """Long-lived SendGrid client shared by every send on this sender"""
+        if self._client is None:
+            self._client = SendGridAPIClient(self.api_key, host=self.host)
+        return self._client
+
     def send_email(self, to_email, subject, body):
         """
         使用 SendGrid 發送郵件
         """
         try:
-            logging.info(f"Attempting to send email to {to_email}")
-            logging.info(f"Subject: {subject}")
-            
+            # 逐封的細節只在 DEBUG 輸出，大量寄送時以 send_groups 的批次摘要為準
+            logging.debug(f"Sending email to {to_email}, subject: {subject}")
+
             # 創建郵件
             message = Mail(
                 from_email=Email(self.from_email),
@@ -44,27 +58,148 @@ class EmailSender:
                 plain_text_content=Content("text/plain", body)
             )
             
-            # 初始化 SendGrid 客戶端
-            sg = SendGridAPIClient(self.api_key)
-            
             # 發送郵件
-            response = sg.send(message)
+            response = self.client.send(message)
             
             # 檢查回應
             if response.status_code in [200, 201, 202]:
-                logging.info(f"Email sent successfully to {to_email}")
-                logging.info(f"SendGrid response status code: {response.status_code}")
+                metrics.incr("emails_sent")
+                logging.debug(f"Email sent to {to_email}, status code: {response.status_code}",
+                              extra={"event": "email_sent"})
                 return True
             else:
-                logging.error(f"Failed to send email. Status code: {response.status_code}")
-                logging.error(f"Response body: {response.body}")
+                metrics.incr("emails_failed")
+                logging.error(f"Failed to send email to {to_email}. Status code: {response.status_code}, "
+                              f"body: {response.body}", extra={"event": "email_failed"})
                 return False
-                
+
         except Exception as e:
-            logging.error(f"Error sending email: {str(e)}")
-            logging.error("Full error details:", exc_info=True)
+            metrics.incr("emails_failed")
+            # Full tracebacks only when debugging; the message is enough to spot the cause
+            logging.error(f"Error sending email to {to_email}: {str(e)}", extra={"event": "email_failed"},
+                          exc_info=logging.getLogger().isEnabledFor(logging.DEBUG))
             return False
 
+    def send_bulk(self, recipients: Iterable, subject: str, body: str, html_body: str = None,
+                  batch_size: int = MAX_PERSONALIZATIONS, max_concurrency: int = 4) -> Dict[str, bool]:
+        """
+        Send the same message to many recipients, packing up to 1000 of them
+        into each SendGrid request as separate personalizations.
+
+        Args:
+            recipients: email addresses, or (email, substitutions) pairs where
+                substitutions maps tokens in subject/body to per-recipient values
+            subject (str): Subject line, may contain substitution tokens
+            body (str): Plain text body, may contain substitution tokens
+            html_body (str): Optional HTML alternative of the body
+            batch_size (int): Recipients per request, capped at 1000
+            max_concurrency (int): Number of requests in flight at once
+
+        Returns:
+            dict: Email address -> True if SendGrid accepted it
+        """
+        return self.send_groups([(subject, body, html_body, recipients)], batch_size, max_concurrency)
+
+    def send_groups(self, groups: Iterable, batch_size: int = MAX_PERSONALIZATIONS,
+                    max_concurrency: int = 4) -> Dict[str, bool]:
+        """
+        Send several pre-rendered messages, each to its own recipient list.
+        Recipients of different groups are packed into the same requests: each
+        group's rendered body is sent once per request as a SendGrid section and
+        every personalization points at its group's section.
+
+        Args:
+            groups: (subject, body, html_body, recipients) tuples, see send_bulk
+            batch_size (int): Recipients per request, capped at 1000
+            max_concurrency (int): Number of requests in flight at once
+
+        Returns:
+            dict: Email address -> True if SendGrid accepted it
+        """
+        batch_size = max(1, min(batch_size, MAX_PERSONALIZATIONS))
+        groups = list(groups)
+        batches = []
+        batch = []
+        for index, (_, _, _, recipients) in enumerate(groups):
+            for recipient in recipients:
+                if isinstance(recipient, str):
+                    recipient = (recipient, None)
+                batch.append((index, *recipient))
+                if len(batch) == batch_size:
+                    batches.append(batch)
+                    batch = []
+        if batch:
+            batches.append(batch)
+        if not batches:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            outcomes = pool.map(lambda b: self._send_batch(b, groups), batches)
+            results = {}
+            failures = Counter()
+            for batch, error in zip(batches, outcomes):
+                results.update((email, error is None) for _, email, _ in batch)
+                if error is not None:
+                    failures[error] += 1
+        # One summary line per call instead of a line per request or recipient
+        sent = sum(results.values())
+        logging.info(f"Bulk send finished: {sent}/{len(results)} recipients in {len(batches)} requests",
+                     extra={"event": "bulk_send", "sent": sent, "recipients": len(results),
+                            "requests": len(batches)})
+        if failures:
+            logging.error(f"{sum(failures.values())} requests failed: "
+                          + "; ".join(f"{error} (x{count})" for error, count in failures.most_common()),
+                          extra={"event": "bulk_send_failed", "failures": dict(failures)})
+        return results
+
+    def _send_batch(self, batch, groups):
+        """Send one request; returns None on success, otherwise a short error description"""
+        used = sorted({index for index, _, _ in batch})
+        has_html = any(groups[index][2] for index in used)
+        personalizations = []
+        for index, email, substitutions in batch:
+            personalization = {"to": [{"email": email}]}
+            substitutions = {k: str(v) for k, v in (substitutions or {}).items()}
+            if len(used) > 1:
+                personalization["subject"] = groups[index][0]
+                substitutions["-alert_text-"] = f"-section{index}_text-"
+                if has_html:
+                    substitutions["-alert_html-"] = f"-section{index}_html-"
+            if substitutions:
+                personalization["substitutions"] = substitutions
+            personalizations.append(personalization)
+
+        subject, body, html_body, _ = groups[used[0]]
+        message = {
+            "personalizations": personalizations,
+            "from": {"email": self.from_email},
+            "subject": subject,
+        }
+        if len(used) == 1:
+            content = [{"type": "text/plain", "value": body}]
+            if html_body:
+                content.append({"type": "text/html", "value": html_body})
+        else:
+            content = [{"type": "text/plain", "value": "-alert_text-"}]
+            sections = {f"-section{i}_text-": groups[i][1] for i in used}
+            if has_html:
+                content.append({"type": "text/html", "value": "-alert_html-"})
+                sections.update((f"-section{i}_html-", groups[i][2] or groups[i][1]) for i in used)
+            message["sections"] = sections
+        message["content"] = content
+
+        try:
+            with metrics.span("send_batch"):
+                response = self.client.send(message)
+            if response.status_code in [200, 201, 202]:
+                metrics.incr("emails_sent", len(batch))
+                return None
+            error = f"status code {response.status_code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        metrics.incr("emails_failed", len(batch))
+        return error
+
 def send_test_email(recipient: str) -> bool:
     """
     Send a test email to verify the email configuration.
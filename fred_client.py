@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+FRED_BASE_URL = os.getenv("FRED_BASE_URL", "https://api.stlouisfed.org/fred")
+
+# 整條公債殖利率曲線，加上房貸與 SOFR
+TREASURY_CURVE = [
+    "DGS1MO", "DGS3MO", "DGS6MO", "DGS1", "DGS2", "DGS3",
+    "DGS5", "DGS7", "DGS10", "DGS20", "DGS30",
+]
+DEFAULT_SERIES = TREASURY_CURVE + ["MORTGAGE30US", "MORTGAGE15US", "SOFR"]
+
+
+class Observation(NamedTuple):
+    series_id: str
+    date: str
+    value: float
+    realtime_start: Optional[str] = None
+
+
+class RateLimiter:
+    """Token bucket：平均每秒 rate 次，最多連續 burst 次（FRED 限制每分鐘 120 次）"""
+
+    def __init__(self, rate=2.0, burst=20):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FredClient:
+    """共用 keep-alive 連線池的 FRED API 客戶端，可同時抓取多個序列"""
+
+    def __init__(self, api_key=None, base_url=FRED_BASE_URL, max_workers=20,
+                 rate_limiter=None, timeout=10):
+        if api_key is None:
+            load_dotenv()
+            api_key = os.getenv('FRED_API_KEY')
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_json(self, path, **params):
+        if not self.api_key:
+            raise ValueError("找不到 FRED API Key")
+        self.rate_limiter.acquire()
+        metrics.incr("fred_requests")
+        params.update(api_key=self.api_key, file_type='json')
+        response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def series_metadata(self, series_id):
+        """取得序列的 realtime_start / last_updated，用來判斷資料是否有更新"""
+        seriess = self.get_json("series", series_id=series_id).get('seriess') or []
+        if not seriess:
+            raise ValueError(f"FRED 找不到序列 {series_id}")
+        return {
+            "realtime_start": seriess[0].get("realtime_start"),
+            "last_updated": seriess[0].get("last_updated"),
+        }
+
+    def observations(self, series_id, **params):
+        return self.get_json("series/observations", series_id=series_id, **params).get('observations') or []
+
+    def latest_observation(self, series_id, lookback=10) -> Observation:
+        """最新一筆有效觀測值；FRED 以 '.' 表示缺失數據，遇到時往前找"""
+        observations = self.observations(series_id, sort_order='desc', limit=lookback)
+        if not observations:
+            raise ValueError("FRED 返回的數據格式不符合預期")
+        for obs in observations:
+            if obs['value'] != '.':
+                return Observation(series_id, obs['date'], float(obs['value']), obs.get('realtime_start'))
+        raise ValueError("FRED 返回了缺失數據")
+
+    def fetch_latest(self, series_ids: Iterable[str]) -> Dict[str, Optional[Observation]]:
+        """以執行緒池同時抓取多個序列的最新觀測值，失敗的序列對應 None"""
+        series_ids = list(dict.fromkeys(series_ids))
+        if not series_ids:
+            return {}
+
+        def fetch(series_id):
+            try:
+                return self.latest_observation(series_id)
+            except Exception as e:
+                logging.error(f"獲取 {series_id} 時發生錯誤: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(series_ids))) as pool:
+            return dict(zip(series_ids, pool.map(fetch, series_ids)))
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """行程內共用的 FredClient，讓所有呼叫者共用同一個連線池"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = FredClient()
+        return _default_client
@@ -0,0 +1,118 @@
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+import fred_client
+
+DEFAULT_HISTORY_DIR = Path(os.getenv("HISTORY_DIR", Path(__file__).with_name("history")))
+
+DATE_DTYPE = np.dtype("<i8")     # 距 1970-01-01 的天數，可零拷貝轉成 datetime64[D]
+VALUE_DTYPE = np.dtype("<f8")    # FRED 的 '.' 缺失值存成 NaN
+FRED_PAGE_LIMIT = 100000
+
+
+class HistoryStore:
+    """
+    以序列 ID 區分的本地時間序列庫。每個序列是兩個只增不改的二進位檔
+    （日期與數值），讀取時以 np.memmap 映射，不需複製整段歷史。
+    """
+
+    def __init__(self, root=DEFAULT_HISTORY_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, series_id):
+        return self.root / f"{series_id}.dates", self.root / f"{series_id}.values"
+
+    def _length(self, series_id):
+        """兩個檔案中完整寫入的筆數；寫到一半中斷時以較短者為準"""
+        dates_path, values_path = self._paths(series_id)
+        if not dates_path.exists() or not values_path.exists():
+            return 0
+        return min(dates_path.stat().st_size // DATE_DTYPE.itemsize,
+                   values_path.stat().st_size // VALUE_DTYPE.itemsize)
+
+    def read(self, series_id):
+        """回傳 (dates, values)：datetime64[D] 與 float64 的唯讀記憶體映射陣列"""
+        length = self._length(series_id)
+        if length == 0:
+            return np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=VALUE_DTYPE)
+        dates_path, values_path = self._paths(series_id)
+        dates = np.memmap(dates_path, dtype=DATE_DTYPE, mode="r", shape=(length,))
+        values = np.memmap(values_path, dtype=VALUE_DTYPE, mode="r", shape=(length,))
+        return dates.view("datetime64[D]"), values
+
+    def last_date(self, series_id):
+        """最後一筆資料的日期（datetime64[D]），沒有資料時回傳 None"""
+        length = self._length(series_id)
+        if length == 0:
+            return None
+        dates_path, _ = self._paths(series_id)
+        with open(dates_path, "rb") as f:
+            f.seek((length - 1) * DATE_DTYPE.itemsize)
+            return np.frombuffer(f.read(DATE_DTYPE.itemsize), dtype=DATE_DTYPE).view("datetime64[D]")[0]
+
+    def append(self, series_id, dates, values):
+        """附加新觀測值；日期必須遞增且晚於已儲存的最後一天"""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=VALUE_DTYPE)
+        if len(dates) != len(values):
+            raise ValueError("dates 與 values 長度不一致")
+        if len(dates) == 0:
+            return 0
+        if np.any(np.diff(dates.astype(DATE_DTYPE)) <= 0):
+            raise ValueError("日期必須嚴格遞增")
+        last = self.last_date(series_id)
+        if last is not None and dates[0] <= last:
+            raise ValueError(f"{series_id} 已有 {last} 之前的資料，只能附加之後的日期")
+
+        # 先截掉上次中斷留下的殘餘資料，再依序寫入數值與日期
+        length = self._length(series_id)
+        dates_path, values_path = self._paths(series_id)
+        for path, dtype, data in ((values_path, VALUE_DTYPE, values),
+                                  (dates_path, DATE_DTYPE, dates.astype(DATE_DTYPE))):
+            with open(path, "ab") as f:
+                f.truncate(length * dtype.itemsize)
+                f.write(data.astype(dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return len(dates)
+
+    def sync(self, series_id, client=None):
+        """只向 FRED 請求最後儲存日期之後的觀測值並附加，回傳新增筆數"""
+        client = client or fred_client.get_client()
+        last = self.last_date(series_id)
+        params = {"sort_order": "asc", "limit": FRED_PAGE_LIMIT}
+        if last is not None:
+            params["observation_start"] = str(last + np.timedelta64(1, "D"))
+        added = 0
+        offset = 0
+        while True:
+            page = client.observations(series_id, offset=offset, **params)
+            observations = page
+            if last is not None:
+                # 保險起見過濾掉不晚於已儲存日期的資料，維持只增不改
+                observations = [o for o in page if np.datetime64(o["date"], "D") > last]
+            if observations:
+                dates = [o["date"] for o in observations]
+                values = [np.nan if o["value"] == "." else float(o["value"]) for o in observations]
+                added += self.append(series_id, dates, values)
+                last = np.datetime64(dates[-1], "D")
+            if len(page) < FRED_PAGE_LIMIT:
+                break
+            offset += FRED_PAGE_LIMIT
+        logging.info(f"{series_id} 歷史資料新增 {added} 筆")
+        return added
+
+
+if __name__ == "__main__":
+    import sys
+
+    import log_setup
+
+    log_setup.configure()
+    store = HistoryStore()
+    for series_id in sys.argv[1:] or ["DGS10"]:
+        store.sync(series_id)
@@ -0,0 +1,246 @@
+import json
+import logging
+import math
+import os
+import re
+from collections import deque
+from pathlib import Path
+
+from atomic_file import atomic_write_json
+
+DEFAULT_STATE_PATH = Path(os.getenv("INDICATOR_STATE_PATH", Path(__file__).with_name("indicator_state.json")))
+
+# 衍生訊號以 series_id 表示，與一般序列共用訂閱與狀態機：
+#   DGS10:ma50     50 個交易日移動平均
+#   DGS10:change   與前一個交易日相比的變化
+#   DGS10:high52w  52 週最高，DGS10:low52w 52 週最低
+#   DGS10-DGS2     兩個序列同一天的利差
+_KEY_PATTERN = re.compile(
+    r"^(?P<series>[A-Z0-9]+)(?::(?P<kind>ma(?P<window>\d+)|change|high52w|low52w)|-(?P<other>[A-Z0-9]+))$"
+)
+DAYS_52W = 364
+
+
+class MovingAverage:
+    """環形緩衝區保存最近 window 筆，維護累計和，每筆 O(1)"""
+
+    def __init__(self, window, buffer=None, pos=0, total=0.0):
+        self.window = window
+        self.buffer = buffer or []
+        self.pos = pos
+        self.total = total
+
+    def push(self, day, value):
+        if len(self.buffer) < self.window:
+            self.buffer.append(value)
+            self.total += value
+            return
+        self.total += value - self.buffer[self.pos]
+        self.buffer[self.pos] = value
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            # 每繞一圈重算一次，避免浮點誤差隨時間累積；攤提後仍是 O(1)
+            self.total = math.fsum(self.buffer)
+
+    @property
+    def value(self):
+        return self.total / self.window if len(self.buffer) == self.window else None
+
+    def state(self):
+        return {"buffer": self.buffer, "pos": self.pos, "total": self.total}
+
+
+class Change:
+    """與前一筆觀測值的差"""
+
+    def __init__(self, previous=None, current=None):
+        self.previous = previous
+        self.current = current
+
+    def push(self, day, value):
+        self.previous, self.current = self.current, value
+
+    @property
+    def value(self):
+        return None if self.previous is None else self.current - self.previous
+
+    def state(self):
+        return {"previous": self.previous, "current": self.current}
+
+
+class RollingExtreme:
+    """單調佇列維護 days 天內的最大（或最小）值，每筆攤提 O(1)"""
+
+    def __init__(self, days, highest, window=None):
+        self.days = days
+        self.highest = highest
+        self.window = deque(tuple(item) for item in window or ())
+
+    def push(self, day, value):
+        window = self.window
+        if self.highest:
+            while window and window[-1][1] <= value:
+                window.pop()
+        else:
+            while window and window[-1][1] >= value:
+                window.pop()
+        window.append((day, value))
+        while window[0][0] <= day - self.days:
+            window.popleft()
+
+    @property
+    def value(self):
+        return self.window[0][1] if self.window else None
+
+    def state(self):
+        return {"window": [list(item) for item in self.window]}
+
+
+class Spread:
+    """兩個序列同一天的差；兩邊資料到齊的最新一天才更新"""
+
+    def __init__(self, pending=None, day=None, spread=None):
+        # 尚未配對的觀測值，兩個序列各自以日期為鍵（存檔時 JSON 鍵為字串）
+        self.pending = [{int(d): v for d, v in p.items()} for p in pending or ({}, {})]
+        self.day = day
+        self.spread = spread
+
+    def push_side(self, side, day, value):
+        other = self.pending[1 - side]
+        if day in other:
+            first, second = (value, other[day]) if side == 0 else (other[day], value)
+            if self.day is None or day > self.day:
+                self.day, self.spread = day, first - second
+            # 已配對日期之前的資料不會再用到
+            for pending in self.pending:
+                for stale in [d for d in pending if d <= day]:
+                    del pending[stale]
+        else:
+            self.pending[side][day] = value
+
+    @property
+    def value(self):
+        return self.spread
+
+    def state(self):
+        return {"pending": [{str(d): v for d, v in p.items()} for p in self.pending],
+                "day": self.day, "spread": self.spread}
+
+
+def parse_key(key):
+    """衍生訊號的 series_id 解析為 (輸入序列, 建立指標的函式)；一般序列回傳 None"""
+    match = _KEY_PATTERN.match(key)
+    if match is None or (match["kind"] is None and match["other"] is None):
+        return None
+    series, kind = match["series"], match["kind"]
+    if match["other"]:
+        return (series, match["other"]), lambda state: Spread(**(state or {}))
+    if match["window"]:
+        window = int(match["window"])
+        if window < 1:
+            return None
+        return (series,), lambda state: MovingAverage(window, **(state or {}))
+    if kind == "change":
+        return (series,), lambda state: Change(**(state or {}))
+    highest = kind == "high52w"
+    return (series,), lambda state: RollingExtreme(DAYS_52W, highest, **(state or {}))
+
+
+def is_derived(series_id):
+    return parse_key(series_id) is not None
+
+
+class IndicatorEngine:
+    """
+    逐筆推進的滾動指標。每個指標記錄各輸入序列已處理到的日期，每次只餵入之後的
+    新觀測值，狀態存在 indicator_state.json，每日評估不必重算整段歷史。
+    """
+
+    def __init__(self, keys, path=DEFAULT_STATE_PATH):
+        self.path = Path(path)
+        saved = self._load()
+        self.indicators = {}
+        self.inputs = {}
+        self.last_days = {}
+        for key in dict.fromkeys(keys):
+            parsed = parse_key(key)
+            if parsed is None:
+                raise ValueError(f"不是衍生訊號: {key}")
+            inputs, factory = parsed
+            entry = saved.get(key)
+            self.indicators[key] = factory(entry["state"] if entry else None)
+            self.inputs[key] = inputs
+            self.last_days[key] = entry["last_days"] if entry else [None] * len(inputs)
+
+    def _load(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"指標狀態無法讀取，將從歷史資料重建: {str(e)}")
+            return {}
+
+    def series_ids(self):
+        return list(dict.fromkeys(s for inputs in self.inputs.values() for s in inputs))
+
+    def _push(self, key, side, day, value):
+        indicator = self.indicators[key]
+        if isinstance(indicator, Spread):
+            indicator.push_side(side, day, value)
+        else:
+            indicator.push(day, value)
+        self.last_days[key][side] = day
+
+    def update(self, series_id, dates, values):
+        """
+        餵入某序列依日期遞增的觀測值（dates 為 1970-01-01 起的天數，與 values 皆為
+        NumPy 陣列；只用陣列方法，本模組不必在啟動時載入 NumPy），
+        每個指標只處理它尚未看過的日期，NaN 缺失值略過。
+        """
+        for key, inputs in self.inputs.items():
+            for side, name in enumerate(inputs):
+                if name != series_id:
+                    continue
+                last = self.last_days[key][side]
+                start = 0 if last is None else int(dates.searchsorted(last, side="right"))
+                for day, value in zip(dates[start:].tolist(), values[start:].tolist()):
+                    if not math.isnan(value):
+                        self._push(key, side, day, value)
+
+    def catch_up(self, history):
+        """從 HistoryStore 讀出各指標尚未處理的部分並推進"""
+        for series_id in self.series_ids():
+            dates, values = history.read(series_id)
+            self.update(series_id, dates.astype("int64"), values)
+
+    def values(self):
+        return {key: indicator.value for key, indicator in self.indicators.items()
+                if indicator.value is not None}
+
+    def save(self):
+        # 保留其他指標（例如這次沒有訂閱者的）的狀態
+        data = self._load()
+        for key, indicator in self.indicators.items():
+            data[key] = {"last_days": self.last_days[key], "state": indicator.state()}
+        atomic_write_json(self.path, data)
+
+
+def evaluate(keys, history=None, client=None, path=DEFAULT_STATE_PATH):
+    """同步輸入序列的歷史資料、推進指標並存檔，回傳 {series_id: 目前值}"""
+    from history_store import HistoryStore
+
+    history = history or HistoryStore()
+    engine = IndicatorEngine(keys, path)
+    for series_id in engine.series_ids():
+        history.sync(series_id, client)
+    engine.catch_up(history)
+    engine.save()
+    values = engine.values()
+    for key in engine.indicators:
+        if key in values:
+            logging.info(f"{key} 當前值: {values[key]:.4f}")
+        else:
+            logging.warning(f"{key} 歷史資料不足，暫時無法計算")
+    return values
@@ -0,0 +1,203 @@
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# 日誌設定皆可由環境變數調整：
+#   LOG_FORMAT        text（預設）或 json，json 每行一筆，方便送進日誌系統
+#   LOG_LEVEL         預設 INFO
+#   LOG_SAMPLE        依訊息類型抽樣，例如 "send_batch=0.01,rate_fetch=0.5"，只套用在 WARNING 以下
+#   LOG_RATE_LIMIT    同一類訊息每個時間窗最多輸出幾筆，0 表示不限制
+#   LOG_RATE_WINDOW   速率限制的時間窗（秒）
+# 訊息類型預設為呼叫位置（模組:行號），也可用 extra={"event": ...} 指定
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "100"))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "60"))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# LogRecord 本身的屬性；其餘屬性來自 extra，JSON 輸出時一併寫出
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "event"}
+
+
+def parse_sample_rates(text):
+    """把 "a=0.1,b=0.5" 解析成 {"a": 0.1, "b": 0.5}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, rate = item.partition("=")
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError(f"抽樣比例需介於 0 與 1: {item}")
+        rates[name.strip()] = rate
+    return rates
+
+
+def event_of(record):
+    return getattr(record, "event", None) or f"{record.module}:{record.lineno}"
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆日誌輸出成一行 JSON，extra 帶入的欄位原樣保留"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": event_of(record),
+            "message": record.getMessage(),
+        }
+        if record.processName != "MainProcess":
+            data["process"] = record.processName
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    依訊息類型抽樣與限速。抽樣以計數決定（比例 0.1 即每 10 筆留 1 筆，0.7 即留 7 筆），
+    不受亂數影響；限速時被略過的筆數會附註在該類型下一筆輸出的訊息後面。
+    CRITICAL 一律輸出。
+    """
+
+    def __init__(self, sample_rates=None, rate_limit=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limit = rate_limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+        event = event_of(record)
+        with self._lock:
+            rate = self.sample_rates.get(event)
+            if rate is not None and record.levelno < logging.WARNING:
+                seen = self._seen.get(event, 0)
+                self._seen[event] = seen + 1
+                # 累計應保留的筆數 ceil(n * rate) 增加時才輸出，任意比例長期都準確
+                if math.ceil((seen + 1) * rate) == math.ceil(seen * rate):
+                    return False
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            started, emitted, suppressed = self._windows.get(event, (now, 0, 0))
+            if now - started >= self.window:
+                started, emitted = now, 0
+            if emitted >= self.rate_limit:
+                self._windows[event] = (started, emitted, suppressed + 1)
+                return False
+            self._windows[event] = (started, emitted + 1, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()}（先前另略過 {suppressed} 筆同類訊息）"
+            record.args = None
+            record.suppressed = suppressed
+        return True
+
+    def suppressed(self):
+        """目前仍被限速略過、尚未附註輸出的筆數 {訊息類型: 筆數}"""
+        with self._lock:
+            return {event: state[2] for event, state in self._windows.items() if state[2]}
+
+
+class _Handler(QueueHandler):
+    """在呼叫端只做格式化訊息與例外的最少工作，寫出交給背景執行緒"""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_handler = None
+_listener = None
+_filter = None
+_running = False
+
+
+def configure(level=None, fmt=None, sample_rates=None, rate_limit=None, window=None, stream=None, force=False):
+    """
+    設定根 logger：呼叫端只把紀錄放入佇列，由背景 QueueListener 格式化並寫出。
+    與 logging.basicConfig 相同，根 logger 已有 handler 時不做任何事（force=True 除外）。
+    """
+    global _handler, _listener, _filter, _running
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return
+    shutdown()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else logging.Formatter(TEXT_FORMAT))
+    _filter = SamplingFilter(
+        parse_sample_rates(LOG_SAMPLE) if sample_rates is None else sample_rates,
+        LOG_RATE_LIMIT if rate_limit is None else rate_limit,
+        LOG_RATE_WINDOW if window is None else window,
+    )
+    _handler = _Handler(queue.Queue())
+    _handler.addFilter(_filter)
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    _running = True
+    root.addHandler(_handler)
+    root.setLevel(level or LOG_LEVEL)
+
+
+def flush():
+    """等待佇列中的紀錄全部寫出"""
+    if _running:
+        _handler.queue.join()
+
+
+def shutdown():
+    """把限速略過的筆數記錄下來，寫完佇列後停止背景執行緒"""
+    global _listener, _running
+    if _listener is None:
+        return
+    for event, count in _filter.suppressed().items():
+        _handler.queue.put(logging.makeLogRecord({
+            "name": "root", "levelno": logging.WARNING, "levelname": "WARNING", "event": event,
+            "msg": f"{event} 另有 {count} 筆訊息因限速未輸出", "suppressed": count,
+        }))
+    if _running:
+        _listener.stop()
+    _listener = None
+    _running = False
+
+
+def _after_fork():
+    # 背景執行緒不會跟著 fork 到子行程，換一個新佇列重新啟動；fork 當下若有其他
+    # 執行緒持有抽樣的鎖，子行程裡的鎖永遠不會被釋放，也要換一個新的
+    global _listener, _running
+    if _listener is None:
+        return
+    _filter._lock = threading.Lock()
+    _handler.queue = queue.Queue()
+    _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    _running = True
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(shutdown)
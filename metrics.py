@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from atomic_file import atomic_write_text
+
+# 設定 MONITOR_METRICS_FILE 才啟用；副檔名 .prom 輸出 Prometheus textfile，其餘輸出 JSON lines
+METRICS_FILE = os.getenv("MONITOR_METRICS_FILE")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """每次監控執行的分段耗時與計數器；停用時 span/incr 直接返回"""
+
+    def __init__(self, path=METRICS_FILE):
+        self.path = Path(path) if path else None
+        self.enabled = self.path is not None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.spans = {}
+        self.counters = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                count, total, longest = self.spans.get(name, (0, 0.0, 0.0))
+                self.spans[name] = (count + 1, total + elapsed, max(longest, elapsed))
+
+    def incr(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        parts = [f"{name} {total:.3f}s" + (f" x{count}" if count > 1 else "")
+                 for name, (count, total, _) in self.spans.items()]
+        parts += [f"{name}={value}" for name, value in self.counters.items()]
+        return ", ".join(parts)
+
+    def write(self):
+        """把本次執行的結果寫入指標檔，並在日誌輸出摘要"""
+        if not self.enabled:
+            return
+        logging.info(f"執行統計: {self.summary()}")
+        if self.path.suffix == ".prom":
+            self._write_prometheus()
+        else:
+            record = {
+                "timestamp": datetime.fromtimestamp(self.started).isoformat(),
+                "duration_seconds": round(time.time() - self.started, 6),
+                "spans": {name: {"count": c, "seconds": round(t, 6), "max_seconds": round(m, 6)}
+                          for name, (c, t, m) in self.spans.items()},
+                "counters": dict(self.counters),
+            }
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _write_prometheus(self):
+        # node_exporter 的 textfile collector 需要整檔替換，避免讀到寫一半的內容
+        lines = [
+            "# TYPE monitor_span_seconds gauge",
+            *(f'monitor_span_seconds{{span="{n}"}} {t:.6f}' for n, (_, t, _) in self.spans.items()),
+            "# TYPE monitor_span_count gauge",
+            *(f'monitor_span_count{{span="{n}"}} {c}' for n, (c, _, _) in self.spans.items()),
+            "# TYPE monitor_span_max_seconds gauge",
+            *(f'monitor_span_max_seconds{{span="{n}"}} {m:.6f}' for n, (_, _, m) in self.spans.items()),
+        ]
+        for name, value in self.counters.items():
+            lines += [f"# TYPE monitor_{name} gauge", f"monitor_{name} {value}"]
+        lines.append(f"monitor_last_run_timestamp_seconds {self.started:.0f}")
+        atomic_write_text(self.path, "\n".join(lines) + "\n")
+
+
+registry = Metrics()
+span = registry.span
+incr = registry.incr
+reset = registry.reset
+write = registry.write
@@ -1,145 +1,301 @@
+import argparse
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from email_sender import EmailSender
 from pathlib import Path
-import requests
-from dotenv import load_dotenv
 
-# 設置日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# 其他模組在 import 時就讀取環境變數（SUBSCRIPTIONS_DB、OUTBOX_*、LOG_* 等），
+# 必須在載入它們之前先讀入 .env；合併分片結果時不安裝套件，沒有 dotenv 也能執行
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
 
-def get_current_rate():
-    """從 FRED API 獲取當前利率"""
+from atomic_file import atomic_write_json
+import log_setup
+import metrics
+from outbox import DEAD, MAX_ATTEMPTS, PENDING, RETRY_BACKOFF, Outbox
+import rate_cache
+import rate_sources
+from alert_state import AlertStateMachine
+from subscription_store import SubscriptionStore, parse_shard
+
+# 單次執行時等待寄送重試的上限（秒）；排程一天只跑一次，暫時性的失敗要在這次內重試
+SEND_RETRY_BUDGET = float(os.getenv("MONITOR_SEND_RETRY_BUDGET", "300"))
+# 排程執行的間隔（秒），例如每天一次的 workflow 設為 86400；摘要時間窗在下次執行前
+# 就會結束的通知這次先寄出。常駐模式持續輪詢，保持 0 即可
+RUN_INTERVAL = float(os.getenv("MONITOR_RUN_INTERVAL", "0"))
+
+# 設置日誌：寫出由背景執行緒處理，大量訂閱時不拖慢評估與寄送
+log_setup.configure()
+
+# 啟動時只載入標準函式庫與本專案的輕量模組；sendgrid、requests、NumPy 等
+# 依賴在真正用到時才載入（見 benchmark.py --startup 的啟動時間預算）
+
+def get_current_rate(max_age=None):
+    """獲取當前 10 年期利率：快取新鮮時直接使用，否則 FRED 為主、Yahoo 為輔並行請求"""
     try:
-        # 載入環境變數
-        load_dotenv()
-        api_key = os.getenv('FRED_API_KEY')
-        
-        if not api_key:
-            logging.error("找不到 FRED API Key")
-            return None
-            
+        rate = rate_cache.get_default_cache().fresh(max_age)
+        if rate is not None:
+            logging.info(f"當前利率（快取）: {rate}%")
+            return rate
+
         logging.info("正在從 FRED 獲取利率數據...")
-        
-        # FRED API endpoint
-        url = "https://api.stlouisfed.org/fred/series/observations"
-        params = {
-            'series_id': 'DGS10',  # 10-Year Treasury Rate
-            'api_key': api_key,
-            'sort_order': 'desc',
-            'limit': 1,
-            'file_type': 'json'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('observations') and len(data['observations']) > 0:
-                # 檢查是否有有效數據
-                value = data['observations'][0]['value']
-                if value != '.':  # FRED 有時會用 '.' 表示缺失數據
-                    rate = float(value)
-                    logging.info(f"當前利率: {rate}%")
-                    return rate
-                else:
-                    logging.warning("FRED 返回了缺失數據")
-            else:
-                logging.warning("FRED 返回的數據格式不符合預期")
-        else:
-            logging.error(f"FRED API 請求失敗: {response.status_code}")
-            
-    except requests.exceptions.RequestException as e:
-        logging.error(f"請求異常: {str(e)}")
-    except ValueError as e:
-        logging.error(f"數據解析錯誤: {str(e)}")
+        result = rate_sources.get_default_fetcher().fetch()
+        if result is None:
+            return None
+        if result.degraded:
+            logging.warning(f"所有即時來源皆失敗，使用 {result.source} 的舊資料")
+        logging.info(f"當前利率: {result.value}%（來源: {result.source}）")
+        return result.value
     except Exception as e:
         logging.error(f"獲取利率時發生未知錯誤: {str(e)}")
-        
+
     return None
 
-def check_conditions(current_rate, target_rate, condition):
-    """檢查是否達到通知條件"""
-    if condition == "greater than or equal to":
-        return current_rate >= target_rate
-    elif condition == "less than or equal to":
-        return current_rate <= target_rate
-    return False
+def get_current_rates(series_ids, max_age=None):
+    """同時獲取多個序列的最新利率；DGS10 走共用快取，其餘序列並行向 FRED 請求"""
+    import fred_client
+
+    series_ids = list(dict.fromkeys(series_ids))
+    others = [s for s in series_ids if s != rate_cache.DEFAULT_SERIES_ID]
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        default_rate = None
+        if rate_cache.DEFAULT_SERIES_ID in series_ids:
+            default_rate = pool.submit(get_current_rate, max_age)
+        observations = fred_client.get_client().fetch_latest(others)
+    rates = {s: obs.value for s, obs in observations.items() if obs is not None}
+    if default_rate is not None and default_rate.result() is not None:
+        rates[rate_cache.DEFAULT_SERIES_ID] = default_rate.result()
+    for series_id in others:
+        if series_id in rates:
+            logging.info(f"{series_id} 當前利率: {rates[series_id]}%")
+    return rates
+
+def fetch_rates(store, max_age=None):
+    """
+    取得所有訂閱用到的序列與衍生訊號的目前數值。分片執行時只由協調者
+    呼叫一次，結果交給各分片共用，不會各自向 FRED 請求。
+    """
+    import indicators
+
+    # 衍生訊號（移動平均、利差等）由指標引擎逐日推進
+    series_ids = store.series_ids()
+    shapes = store.rule_shapes()
+    if shapes:
+        import rules
+
+        series_ids = list(dict.fromkeys(series_ids + rules.referenced_series(shapes)))
+    derived = [s for s in series_ids if indicators.is_derived(s)]
+    plain = [s for s in series_ids if s not in derived]
+    with metrics.span("rate_fetch"):
+        rates = get_current_rates(plain, max_age) if plain else {}
+    if derived:
+        try:
+            with metrics.span("indicators"):
+                rates.update(indicators.evaluate(derived))
+        except Exception as e:
+            logging.error(f"計算衍生訊號時發生錯誤: {str(e)}")
+    return rates
+
+def load_store():
+    """開啟訂閱資料庫（首次執行時匯入舊版 config.json）"""
+    store = SubscriptionStore()
+    if store.count() == 0:
+        store.migrate_config_json(Path("config.json"))
+    return store
+
+def main(store=None, sender=None, max_age=None, shard=None, rates=None, report=None):
+    """
+    執行一次完整的監控流程，回傳是否成功取得利率並完成評估。
+    常駐模式會傳入已載入的 store 與 sender，避免每次檢查重新建立；分片執行時
+    傳入 shard=(i, N) 與共用的 rates。傳入 report 字典時填入本次的執行結果。
+    """
+    metrics.reset()
+    report = {} if report is None else report
+    started = time.monotonic()
+    report.update(shard=format_shard(shard), ok=False, rules=0, triggered=0, sent=0, pending=0, dead=0)
+    try:
+        report["ok"] = run_once(store, sender, max_age, shard, rates, report)
+        return report["ok"]
+    finally:
+        report["seconds"] = round(time.monotonic() - started, 3)
+        metrics.write()
 
-def main():
+def run_once(store, sender, max_age, shard, rates, report):
+    run_started = datetime.now().isoformat()
     try:
-        # 讀取配置
-        config_path = Path("config.json")
-        if not config_path.exists():
-            logging.error("找不到配置文件 config.json")
-            return
-            
-        with open(config_path, "r") as f:
-            config = json.load(f)
-            
-        # 檢查配置
-        required_fields = ["email", "target_rate", "condition"]
-        for field in required_fields:
-            if field not in config:
-                logging.error(f"配置文件缺少必要字段: {field}")
-                return
-                
-        logging.info(f"目標郵箱: {config['email']}")
-        logging.info(f"目標利率: {config['target_rate']}%")
-        logging.info(f"條件: {config['condition']}")
-        
-        # 獲取當前利率
-        current_rate = get_current_rate()
-        if current_rate is None:
+        # 讀取訂閱規則
+        with metrics.span("config_load"):
+            store = store or load_store()
+            rule_count = store.count(shard)
+        report["rules"] = rule_count
+        if rule_count == 0:
+            if shard is not None:
+                logging.info(f"分片 {format_shard(shard)} 沒有訂閱規則")
+                return True
+            logging.error("沒有任何訂閱規則")
+            return False
+        logging.info(f"訂閱規則數: {rule_count}")
+
+        # 獲取當前利率（分片執行時使用協調者取得的結果）
+        if rates is None:
+            rates = fetch_rates(store, max_age)
+        if not rates:
             logging.error("無法獲取當前利率，監控終止")
-            return
-
-        # 檢查條件
-        condition_met = check_conditions(current_rate, config["target_rate"], config["condition"])
-        logging.info(f"條件是否達成: {condition_met}")
-        
-        if condition_met:
-            # 發送通知
-            try:
-                sender = EmailSender()
-                subject = f"利率監控通知 - 目標條件已達成"
-                body = f"""
-                您好，
-
-                當前利率已達到您設定的條件：
-
-                當前利率：{current_rate}%
-                目標利率：{config['target_rate']}%
-                條件：{config['condition']}
-
-                時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-                此致，
-                利率監控系統
-                """
-                
-                result = sender.send_email(config["email"], subject, body)
-                if result:
-                    logging.info(f"通知郵件已成功發送至 {config['email']}")
-                else:
-                    logging.error("通知郵件發送失敗")
-                    
-            except Exception as e:
-                logging.error(f"發送通知時發生錯誤: {str(e)}")
+            return False
+
+        # 檢查條件：只在穿越目標時通知，條件持續成立期間不重複寄信
+        with metrics.span("evaluation"):
+            alerts = AlertStateMachine(store, shard=shard)
+            outbox = Outbox(store, shard=shard)
+            now = datetime.now()
+            triggered = 0
+            for series_id, current_rate in rates.items():
+                triggered += len(alerts.advance(series_id, current_rate, now, outbox))
+            if store.rule_shapes():
+                triggered += len(alerts.advance_expressions(rates, now, outbox))
+        metrics.incr("alerts_triggered", triggered)
+        report["triggered"] = triggered
+        logging.info(f"新觸發的規則數: {triggered}")
+
+        # 寄出佇列中所有到期的通知（包含上次中斷留下的）
+        if outbox.count(PENDING):
+            deliver(outbox, sender, report)
         else:
             logging.info("條件未達成，不發送通知")
+        # 只計算這次執行才移到 dead 的訊息，不含過去累積的
+        report["dead"] = outbox.count(DEAD, since=run_started)
+        return True
 
     except json.JSONDecodeError as e:
         logging.error(f"配置文件格式錯誤: {str(e)}")
     except Exception as e:
         logging.error(f"監控過程中發生未知錯誤: {str(e)}")
+    return False
+
+def deliver(outbox, sender=None, report=None):
+    """寄出佇列中已到期的通知，在預算內等待到期的重試；結果填入 report"""
+    report = {} if report is None else report
+    try:
+        if sender is None:
+            # 沒有通知要寄時不必載入 sendgrid
+            from email_sender import EmailSender
+
+            sender = EmailSender()
+        with metrics.span("send"):
+            # 在預算內等待到期的重試，暫時性失敗不必等到下一次排程
+            retry_window = min(MAX_ATTEMPTS * RETRY_BACKOFF, SEND_RETRY_BUDGET)
+            sent = outbox.drain(sender, wait_for_retries=retry_window, send_ahead=RUN_INTERVAL)
+        report["sent"] = sent
+        logging.info(f"通知郵件已成功發送 {sent} 封")
+        waiting = outbox.count(PENDING)
+        report["pending"] = waiting
+        if waiting:
+            logging.warning(f"{waiting} 封通知等待重試或摘要時間窗到期")
+        outbox.purge()
+    except Exception as e:
+        logging.error(f"發送通知時發生錯誤: {str(e)}")
+    return report
+
+def format_shard(shard):
+    return None if shard is None else f"{shard[0]}/{shard[1]}"
+
+def run_shard(args):
+    """在子行程中執行單一分片，回傳該分片的執行結果"""
+    store, index, count, rates, max_age = args
+    report = {}
+    main(store, max_age=max_age, shard=(index, count), rates=rates, report=report)
+    # 子行程結束時不會執行 atexit，回傳前先把日誌寫完
+    log_setup.flush()
+    return report
+
+def run_parallel(processes, max_age=None, store=None):
+    """在本機以 processes 個行程平行處理所有分片；利率只取得一次後傳給各分片"""
+    store = store or load_store()
+    rates = fetch_rates(store, max_age)
+    if not rates:
+        logging.error("無法獲取當前利率，監控終止")
+        return merge_reports([], processes)
+    import multiprocessing
+
+    logging.info(f"以 {processes} 個行程平行處理 {processes} 個分片")
+    # 此時已有執行緒在跑（利率來源的 executor、FRED session、快取背景更新），
+    # fork 會把它們持有的鎖複製到子行程，改用 spawn 啟動乾淨的直譯器
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        reports = pool.map(run_shard, [(store, i, processes, rates, max_age) for i in range(processes)])
+    return merge_reports(reports)
+
+def merge_reports(reports, shards=None):
+    """
+    把各分片的執行結果合併成一份。傳入分片總數 shards 時，缺少結果的分片
+    （中途當掉、沒有上傳）列在 missing，整體視為失敗
+    """
+    merged = {"ok": bool(reports) and all(r["ok"] for r in reports), "shards": sorted(
+        reports, key=lambda r: [int(part) for part in (r["shard"] or "0/1").split("/")]
+    )}
+    if shards is not None:
+        reported = {r["shard"] for r in reports}
+        merged["missing"] = [f"{i}/{shards}" for i in range(shards) if f"{i}/{shards}" not in reported]
+        if merged["missing"]:
+            merged["ok"] = False
+    for key in ("rules", "triggered", "sent", "pending", "dead"):
+        merged[key] = sum(r[key] for r in reports)
+    # 各分片平行執行，整體耗時以最慢的分片為準
+    merged["seconds"] = max((r["seconds"] for r in reports), default=0.0)
+    return merged
+
+def write_json(path, data):
+    atomic_write_json(path, data)
+    logging.info(f"已寫入 {path}")
 
 if __name__ == "__main__":
-    logging.info("=== 利率監控系統啟動 ===")
-    main()
-    logging.info("=== 監控完成 ===") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="利率監控系統")
+    parser.add_argument("--daemon", action="store_true", help="常駐執行，於 H.15 發布時段輪詢")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N", help="只處理第 i 個分片（共 N 個）")
+    parser.add_argument("--processes", type=int, nargs="?", const=os.cpu_count(), metavar="N",
+                        help="在本機以 N 個行程平行處理所有分片，省略 N 時使用全部核心")
+    parser.add_argument("--fetch-rates", metavar="PATH", help="只取得利率並寫入檔案，供各分片共用")
+    parser.add_argument("--rates", metavar="PATH", help="使用 --fetch-rates 寫出的利率，不再自行取得")
+    parser.add_argument("--report", metavar="PATH", help="把執行結果寫成 JSON")
+    parser.add_argument("--merge-reports", nargs="*", metavar="PATH", help="合併各分片的執行結果")
+    parser.add_argument("--shards", type=int, metavar="N", help="合併時預期的分片總數，缺少的分片視為失敗")
+    args = parser.parse_args()
+
+    if args.daemon:
+        import asyncio
+        from monitor_daemon import run_daemon
+        asyncio.run(run_daemon(main, deliver))
+    elif args.fetch_rates:
+        write_json(args.fetch_rates, fetch_rates(load_store()))
+    elif args.merge_reports is not None:
+        reports = []
+        for path in args.merge_reports:
+            with open(path, "r") as f:
+                reports.append(json.load(f))
+        report = merge_reports(reports, args.shards)
+        logging.info(f"合併 {len(reports)} 個分片: 規則 {report['rules']}，觸發 {report['triggered']}，"
+                     f"寄出 {report['sent']}，待重試 {report['pending']}")
+        if report.get("missing"):
+            logging.error(f"缺少分片的執行結果: {', '.join(report['missing'])}")
+        if args.report:
+            write_json(args.report, report)
+    else:
+        logging.info("=== 利率監控系統啟動 ===")
+        if args.processes:
+            report = run_parallel(args.processes)
+        else:
+            rates = None
+            if args.rates:
+                with open(args.rates, "r") as f:
+                    rates = json.load(f)
+            report = {}
+            main(shard=args.shard, rates=rates, report=report)
+        if args.report:
+            write_json(args.report, report)
+        logging.info("=== 監控完成 ===")
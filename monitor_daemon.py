@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import rate_cache
+from outbox import Outbox
+from subscription_store import SubscriptionStore
+
+# H.15 每個營業日約於美東 16:15 發布，FRED 隨後更新 DGS 系列
+RELEASE_TZ = ZoneInfo("America/New_York")
+RELEASE_TIME = time(16, 15)
+POLL_WINDOW = timedelta(hours=float(os.getenv("DAEMON_POLL_WINDOW_HOURS", "6")))
+POLL_INTERVAL = float(os.getenv("DAEMON_POLL_INTERVAL", "300"))
+JITTER = float(os.getenv("DAEMON_JITTER", "30"))
+MAX_BACKOFF = float(os.getenv("DAEMON_MAX_BACKOFF", "1800"))
+
+
+def release_window(day):
+    """指定日期（美東）的輪詢時段 (開始, 結束)"""
+    start = datetime.combine(day, RELEASE_TIME, tzinfo=RELEASE_TZ)
+    return start, start + POLL_WINDOW
+
+
+def next_window(now, done_day=None):
+    """下一個需要輪詢的時段；今天的時段尚未結束且未取得新資料時回傳今天"""
+    day = now.astimezone(RELEASE_TZ).date()
+    while True:
+        start, end = release_window(day)
+        if day.weekday() < 5 and day != done_day and now < end:
+            return max(start, now), end
+        day += timedelta(days=1)
+
+
+def backoff_delay(failures):
+    """連續失敗時以指數退避拉長間隔"""
+    if failures == 0:
+        return POLL_INTERVAL
+    return min(MAX_BACKOFF, POLL_INTERVAL * 2 ** (failures - 1))
+
+
+def latest_observation_date():
+    entry = rate_cache.get_default_cache().load()
+    return entry and entry.get("date")
+
+
+def expected_observation_date(day):
+    """day 的發布時段應取得的觀測日期：FRED 的 DGS 系列晚一個營業日，即前一個營業日"""
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def has_new_data(observed, day):
+    """
+    快取中的觀測日期是否已是 day 的發布時段應取得的資料。只比較是否與時段開始時
+    不同並不可靠：快取沒有日期或落後好幾天時，發布前的第一次輪詢就會被當成新資料
+    """
+    return observed is not None and date.fromisoformat(observed) >= expected_observation_date(day)
+
+
+async def _sleep(stop, seconds):
+    """睡眠直到時間到或收到停止訊號；回傳是否收到停止訊號"""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=max(0.0, seconds))
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def wait_until(stop, wake_at, outbox, send):
+    """
+    睡眠直到 wake_at；期間有通知到期（hourly / daily 摘要時間窗結束或重試）時
+    先醒來呼叫 send 寄出，不必等到下一個輪詢時段。回傳是否收到停止訊號
+    """
+    failures = 0
+    while True:
+        now = datetime.now(RELEASE_TZ)
+        due = outbox.next_due()
+        if due is None or due.astimezone(RELEASE_TZ) >= wake_at:
+            return await _sleep(stop, (wake_at - now).total_seconds())
+        if await _sleep(stop, (due.astimezone(RELEASE_TZ) - now).total_seconds()):
+            return True
+        await asyncio.to_thread(send)
+        # 寄送出錯時訊息的到期時間不會往後移，以退避間隔再試，避免空轉
+        failures = failures + 1 if outbox.next_due() == due else 0
+        if failures and await _sleep(stop, backoff_delay(failures)):
+            return True
+
+
+async def run_daemon(check, send):
+    """
+    常駐輪詢：保留 HTTP 連線池、SendGrid 客戶端與訂閱資料庫，
+    在每個營業日的 H.15 發布時段內輪詢，取得新資料後休息到下一個營業日；
+    休息期間摘要時間窗結束的通知以 send(outbox, sender) 寄出。
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    store = SubscriptionStore()
+    outbox = Outbox(store)
+    try:
+        from email_sender import EmailSender
+        sender = EmailSender()
+    except Exception as e:
+        logging.warning(f"無法預先建立 EmailSender，將於需要時再建立: {str(e)}")
+        sender = None
+
+    logging.info("=== 利率監控常駐模式啟動 ===")
+    done_day = None
+    while not stop.is_set():
+        start, end = next_window(datetime.now(RELEASE_TZ), done_day)
+        if start > datetime.now(RELEASE_TZ):
+            logging.info(f"下一次輪詢時段: {start.isoformat()}")
+        wake_at = start + timedelta(seconds=random.uniform(0, JITTER))
+        if await wait_until(stop, wake_at, outbox, lambda: send(outbox, sender)):
+            break
+
+        failures = 0
+        while not stop.is_set() and datetime.now(RELEASE_TZ) < end:
+            ok = await asyncio.to_thread(check, store, sender, POLL_INTERVAL)
+            failures = 0 if ok else failures + 1
+            if ok and has_new_data(latest_observation_date(), start.date()):
+                logging.info(f"已取得新資料 ({latest_observation_date()})，本日輪詢結束")
+                break
+            delay = backoff_delay(failures) + random.uniform(-JITTER, JITTER)
+            if await _sleep(stop, delay):
+                break
+        done_day = start.date()
+
+    logging.info("=== 收到停止訊號，常駐模式結束 ===")
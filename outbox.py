@@ -0,0 +1,302 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import metrics
+from alert_templates import RECIPIENT_TOKEN, render_alert, render_digest
+from subscription_store import (
+    DIGEST_DAILY, DIGEST_HOURLY, DIGEST_IMMEDIATE, DIGEST_WINDOWS, shard_clause, shard_key
+)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+STATUSES = (PENDING, SENDING, SENT, DEAD)
+
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "30"))
+# 寄送中的訊息超過這個時間仍未回報結果，視為該 worker 已中斷
+LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "600"))
+# 每次取出的訊息數；越大交易次數越少，但中斷時需要等租約過期的訊息也越多
+CLAIM_SIZE = int(os.getenv("OUTBOX_CLAIM_SIZE", "20000"))
+# 收件人未設定時使用的摘要時間窗，以及每日摘要寄出的時刻（DIGEST_TIMEZONE 的當地時間）
+DIGEST_WINDOW = os.getenv("DIGEST_WINDOW", DIGEST_IMMEDIATE)
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "8"))
+DIGEST_TIMEZONE = ZoneInfo(os.getenv("DIGEST_TIMEZONE", "Asia/Taipei"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    subscription_id INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    series_id TEXT NOT NULL,
+    current_rate REAL NOT NULL,
+    target_rate REAL NOT NULL,
+    condition TEXT NOT NULL,
+    locale TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    claimed_at TEXT,
+    sent_at TEXT,
+    last_error TEXT,
+    shard_key INTEGER
+);
+-- 部分索引只包含待寄與寄送中的訊息，寄出後的紀錄不必維護索引；
+-- 待寄訊息依 (到期時間, 收件人) 排序，同一收件人的摘要會被同一批取出
+DROP INDEX IF EXISTS idx_outbox_due;
+CREATE INDEX IF NOT EXISTS idx_outbox_due_email ON outbox (next_attempt_at, email) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_outbox_sending ON outbox (claimed_at) WHERE status = 'sending';
+"""
+
+_CLAIM_COLUMNS = "id, email, series_id, current_rate, target_rate, condition, locale, created_at, attempts"
+
+
+def digest_due(window, now, tz=DIGEST_TIMEZONE):
+    """
+    依摘要時間窗計算通知的寄出時間：immediate 立即，hourly 下一個整點，daily 下一個
+    DIGEST_HOUR 點；整點與日期以 tz 計算。now 不帶時區時視為本機時間，回傳值也是本機時間。
+    """
+    if window not in (DIGEST_HOURLY, DIGEST_DAILY):
+        return now
+    local = now.astimezone(tz)
+    if window == DIGEST_HOURLY:
+        due = local.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    else:
+        due = local.replace(hour=DIGEST_HOUR, minute=0, second=0, microsecond=0)
+        if due <= local:
+            due = (due + timedelta(days=1)).replace(hour=DIGEST_HOUR)
+    return due if now.tzinfo else due.astimezone().replace(tzinfo=None)
+
+
+def _id_ranges(ids):
+    """把排序過的 id 合併成連續區間 [(low, high), ...]"""
+    ranges = []
+    for row_id in ids:
+        if ranges and ranges[-1][1] == row_id - 1:
+            ranges[-1][1] = row_id
+        else:
+            ranges.append([row_id, row_id])
+    return ranges
+
+
+class Outbox:
+    """
+    以 SQLite 保存待寄出的通知。評估階段在同一個交易內觸發規則並寫入佇列，
+    寄送階段再分批取出寄送、重試，超過次數後移到 dead。中斷後重新執行
+    只會接續尚未完成的訊息，idempotency_key 保證同一次觸發不會重複排入。
+    指定 shard=(i, N) 時只取出、統計該分片訂閱者的訊息。
+    排入時依收件人的摘要時間窗（digest_preferences，未設定時為 digest_window）
+    決定寄出時間，寄送時同一收件人的通知合併成一封摘要。
+    """
+
+    def __init__(self, store, max_attempts=MAX_ATTEMPTS, retry_backoff=RETRY_BACKOFF,
+                 lease_seconds=LEASE_SECONDS, shard=None, digest_window=DIGEST_WINDOW):
+        if digest_window not in DIGEST_WINDOWS:
+            raise ValueError(f"不支援的摘要時間窗: {digest_window}")
+        self.store = store
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.shard = shard
+        self._in_shard = shard_clause(shard)
+        with self.store.connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+            if "shard_key" not in columns:
+                conn.execute("ALTER TABLE outbox ADD COLUMN shard_key INTEGER")
+                conn.create_function("shard_key", 1, shard_key, deterministic=True)
+                conn.execute("UPDATE outbox SET shard_key = shard_key(email)")
+
+    def enqueue(self, conn, subscriptions, current_rate, now):
+        """
+        在呼叫端的交易中排入通知；now 為觸發時間，與規則 id 組成 idempotency key。
+        寄出時間依收件人的摘要時間窗決定，在 SQL 內以主鍵查詢設定。
+        """
+        triggered = datetime.fromisoformat(now)
+        due = {window: digest_due(window, triggered).isoformat() for window in DIGEST_WINDOWS}
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox"
+            " (idempotency_key, subscription_id, email, series_id, current_rate, target_rate,"
+            "  condition, locale, created_at, next_attempt_at, shard_key)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?,"
+            "  COALESCE((SELECT CASE digest WHEN ? THEN ? WHEN ? THEN ? ELSE ? END"
+            "            FROM digest_preferences WHERE email = ?), ?), ?)",
+            ((f"{s.id}:{now}", s.id, s.email, s.series_id, current_rate, s.target_rate,
+              s.condition, s.locale, now,
+              DIGEST_HOURLY, due[DIGEST_HOURLY], DIGEST_DAILY, due[DIGEST_DAILY], due[DIGEST_IMMEDIATE],
+              s.email, due[self.digest_window], shard_key(s.email)) for s in subscriptions)
+        )
+        return conn.total_changes - before
+
+    def count(self, status=PENDING, since=None):
+        """某狀態的訊息數；指定 since 時只計算該時間之後被取出寄送過的訊息"""
+        if status not in STATUSES:
+            raise ValueError(f"未知的狀態: {status}")
+        where, params = self._in_shard, ()
+        if since is not None:
+            where += " AND claimed_at >= ?"
+            params = (since,)
+        with self.store.connect() as conn:
+            # 狀態寫成常數才能用上部分索引
+            return conn.execute(
+                f"SELECT COUNT(*) FROM outbox WHERE status = '{status}'" + where, params
+            ).fetchone()[0]
+
+    def purge(self, days=30):
+        """刪除寄出超過 days 天的紀錄，dead 的訊息保留供人工檢查"""
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        with self.store.connect() as conn:
+            return conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND sent_at < ?", (SENT, cutoff)
+            ).rowcount
+
+    def _claim(self, limit, send_ahead=0.0):
+        """
+        取出到期的待寄訊息並標記為寄送中；租約過期的寄送中訊息一併收回。
+        尚未寄過、摘要時間窗在 send_ahead 秒內結束的訊息也提前取出。
+        """
+        now = datetime.now()
+        expired = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        horizon = (now + timedelta(seconds=send_ahead)).isoformat()
+        now = now.isoformat()
+        with self.store.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            reclaimed = conn.execute(
+                f"UPDATE outbox SET status = '{PENDING}' WHERE status = '{SENDING}' AND claimed_at < ?"
+                + self._in_shard,
+                (expired,)
+            ).rowcount
+            if reclaimed:
+                logging.warning(f"收回 {reclaimed} 封中斷時正在寄送的通知")
+            # 以單一語句標記整批，再依 claimed_at 讀回；同一交易內不會混入其他 worker 的訊息
+            claimed = conn.execute(
+                f"UPDATE outbox SET status = '{SENDING}', claimed_at = ?, attempts = attempts + 1 WHERE id IN"
+                f" (SELECT id FROM outbox WHERE status = '{PENDING}' AND next_attempt_at <= ?"
+                f"  AND (attempts = 0 OR next_attempt_at <= ?){self._in_shard}"
+                "  ORDER BY next_attempt_at, email, id LIMIT ?)",
+                (now, horizon, now, limit)
+            ).rowcount
+            if claimed == limit:
+                # 批次邊界上的收件人可能還有同一時間到期的通知，一併取出才不會拆成兩封
+                boundary = conn.execute(
+                    f"SELECT next_attempt_at, email FROM outbox WHERE status = '{SENDING}' AND claimed_at = ?"
+                    " ORDER BY next_attempt_at DESC, email DESC LIMIT 1",
+                    (now,)
+                ).fetchone()
+                conn.execute(
+                    f"UPDATE outbox SET status = '{SENDING}', claimed_at = ?, attempts = attempts + 1"
+                    f" WHERE status = '{PENDING}' AND next_attempt_at = ? AND email = ?",
+                    (now, *boundary)
+                )
+            rows = conn.execute(
+                f"SELECT {_CLAIM_COLUMNS} FROM outbox WHERE status = '{SENDING}' AND claimed_at = ?"
+                + self._in_shard + " ORDER BY id",
+                (now,)
+            ).fetchall()
+        return rows
+
+    def _complete(self, rows, results):
+        now = datetime.now()
+        sent, retry, dead = [], [], []
+        for row in rows:
+            row_id, email, attempts = row[0], row[1], row[8]
+            if results.get(email):
+                sent.append(row_id)
+            elif attempts >= self.max_attempts:
+                dead.append((DEAD, "SendGrid 拒絕或請求失敗", row_id))
+            else:
+                delay = self.retry_backoff * 2 ** (attempts - 1)
+                retry.append((PENDING, (now + timedelta(seconds=delay)).isoformat(),
+                              "SendGrid 拒絕或請求失敗", row_id))
+        with self.store.connect() as conn:
+            # 成功的占絕大多數，依連續 id 區間更新而不是逐列更新
+            for low, high in _id_ranges(sent):
+                conn.execute(
+                    "UPDATE outbox SET status = ?, sent_at = ?, claimed_at = NULL"
+                    " WHERE id BETWEEN ? AND ? AND status = ?",
+                    (SENT, now.isoformat(), low, high, SENDING)
+                )
+            conn.executemany(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ?, claimed_at = NULL WHERE id = ?",
+                retry
+            )
+            # dead 保留最後一次的 claimed_at，供統計某次執行新增的 dead
+            conn.executemany(
+                "UPDATE outbox SET status = ?, last_error = ? WHERE id = ?", dead
+            )
+        metrics.incr("outbox_retries", len(retry))
+        metrics.incr("outbox_dead", len(dead))
+        if dead:
+            logging.error(f"{len(dead)} 封通知重試 {self.max_attempts} 次後仍失敗，已移至 dead")
+        return len(sent)
+
+    @staticmethod
+    def _render(rows):
+        """
+        同一收件人的通知合併成一封摘要（語系取第一則），再把內容相同的收件人
+        合為一組，每組只渲染一次
+        """
+        alerts = defaultdict(list)
+        locales = {}
+        for _, email, series_id, current_rate, target_rate, condition, locale, created_at, _ in rows:
+            alerts[email].append((series_id, current_rate, target_rate, condition, created_at))
+            locales.setdefault(email, locale)
+        groups = defaultdict(list)
+        for email, items in alerts.items():
+            groups[(locales[email], tuple(items))].append(email)
+        messages = []
+        for (locale, items), emails in groups.items():
+            items = [(series_id, current_rate, target_rate, condition,
+                      datetime.fromisoformat(created_at).strftime('%Y-%m-%d %H:%M:%S'))
+                     for series_id, current_rate, target_rate, condition, created_at in items]
+            if len(items) == 1:
+                subject, text, html = render_alert(locale, *items[0])
+            else:
+                subject, text, html = render_digest(locale, items)
+            messages.append((subject, text, html, [(email, {RECIPIENT_TOKEN: email}) for email in emails]))
+        return messages
+
+    def drain(self, sender, workers=4, batch_size=1000, claim_size=CLAIM_SIZE, wait_for_retries=0.0,
+              send_ahead=0.0):
+        """
+        每次取出 claim_size 封到期的訊息，以 workers 個並行請求寄出，回傳成功寄出的
+        數量。wait_for_retries 秒內到期的重試會等待後一併處理。排程執行時 send_ahead
+        設為距下次執行的秒數，摘要時間窗在下次執行前就會結束的通知這次就寄出，
+        不會晚一整個排程週期。
+        """
+        deadline = time.monotonic() + wait_for_retries
+        total = 0
+        while True:
+            rows = self._claim(claim_size, send_ahead)
+            if not rows:
+                next_due = self.next_due()
+                if next_due is None:
+                    break
+                delay = (next_due - datetime.now()).total_seconds()
+                if time.monotonic() + delay > deadline:
+                    break
+                time.sleep(max(0.0, delay))
+                continue
+            with metrics.span("render"):
+                messages = self._render(rows)
+            metrics.incr("render_groups", len(messages))
+            results = sender.send_groups(messages, batch_size=batch_size, max_concurrency=workers)
+            total += self._complete(rows, results)
+        return total
+
+    def next_due(self):
+        """最早到期的待寄訊息時間（本機時間），佇列為空時回傳 None"""
+        with self.store.connect() as conn:
+            row = conn.execute(
+                f"SELECT MIN(next_attempt_at) FROM outbox WHERE status = '{PENDING}'" + self._in_shard
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
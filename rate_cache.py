@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from atomic_file import atomic_write_json
+import metrics
+
+DEFAULT_CACHE_PATH = Path(os.getenv("RATE_CACHE_PATH", Path(__file__).with_name("rate_cache.json")))
+DEFAULT_SERIES_ID = "DGS10"
+
+# 快取有效時間（秒），過期後仍可在 max_stale 內先回傳舊值再背景更新
+DEFAULT_TTL = int(os.getenv("RATE_CACHE_TTL", "3600"))
+DEFAULT_MAX_STALE = int(os.getenv("RATE_CACHE_MAX_STALE", "86400"))
+
+
+class RateCache:
+    """rate_cache.json 的 TTL 快取，供 Streamlit 介面與排程監控共用"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, series_id=DEFAULT_SERIES_ID,
+                 ttl=DEFAULT_TTL, max_stale=DEFAULT_MAX_STALE, client=None):
+        self.path = Path(path)
+        self.series_id = series_id
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._client = client
+        self._revalidating = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import fred_client  # requests 只在實際向 FRED 請求時載入
+
+            self._client = fred_client.get_client()
+        return self._client
+
+    def load(self):
+        """讀取快取內容，檔案不存在、格式錯誤或序列不符時回傳 None"""
+        try:
+            with open(self.path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or "rate" not in entry or "timestamp" not in entry:
+            return None
+        if entry.get("series_id", DEFAULT_SERIES_ID) != self.series_id:
+            return None
+        return entry
+
+    def age(self, entry):
+        """快取距離上次驗證的秒數"""
+        try:
+            checked = datetime.fromisoformat(entry["timestamp"])
+        except (TypeError, ValueError):
+            return float("inf")
+        return (datetime.now() - checked).total_seconds()
+
+    def fresh(self, max_age=None):
+        """快取在 TTL（或 max_age）內時回傳利率，否則回傳 None"""
+        ttl = self.ttl if max_age is None else max_age
+        entry = self.load()
+        if entry is not None and self.age(entry) < ttl:
+            metrics.incr("cache_hits")
+            return entry["rate"]
+        metrics.incr("cache_misses")
+        return None
+
+    def revalidate(self, entry=None):
+        """條件式更新：last_updated 未變時只刷新時間戳，不重新抓觀測值"""
+        metadata = self.client.series_metadata(self.series_id)
+        if entry and entry.get("last_updated") and entry["last_updated"] == metadata["last_updated"]:
+            logging.info(f"{self.series_id} 資料未更新，沿用快取")
+            entry = dict(entry, timestamp=datetime.now().isoformat())
+        else:
+            observation = self.client.latest_observation(self.series_id)
+            entry = {
+                "rate": observation.value,
+                "timestamp": datetime.now().isoformat(),
+                "source": "FRED",
+                "series_id": self.series_id,
+                "date": observation.date,
+                "realtime_start": metadata["realtime_start"],
+                "last_updated": metadata["last_updated"],
+            }
+        atomic_write_json(self.path, entry)
+        return entry
+
+    def _revalidate_in_background(self, entry):
+        if not self._revalidating.acquire(blocking=False):
+            return  # 已有更新在進行中
+
+        def run():
+            try:
+                self.revalidate(entry)
+            except Exception as e:
+                logging.warning(f"背景更新利率快取失敗: {str(e)}")
+            finally:
+                self._revalidating.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, allow_stale=True, max_age=None):
+        """
+        取得利率。快取新鮮時直接回傳；過期但仍在 max_stale 內且 allow_stale
+        時先回傳舊值並於背景更新；否則同步更新。更新失敗時退回 max_stale 內的舊值。
+        max_age 可暫時覆寫 TTL（例如常駐模式輪詢時）。
+        """
+        ttl = self.ttl if max_age is None else max_age
+        entry = self.load()
+        usable = entry is not None and self.age(entry) < ttl + self.max_stale
+        if entry is not None:
+            if self.age(entry) < ttl:
+                metrics.incr("cache_hits")
+                return entry["rate"]
+            if allow_stale and usable:
+                metrics.incr("cache_stale_hits")
+                self._revalidate_in_background(entry)
+                return entry["rate"]
+        metrics.incr("cache_misses")
+        try:
+            return self.revalidate(entry)["rate"]
+        except Exception as e:
+            logging.error(f"更新利率快取失敗: {str(e)}")
+            if usable:
+                logging.warning(f"改用快取中的舊利率 ({entry['timestamp']})")
+                return entry["rate"]
+            return None
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RateCache()
+    return _default_cache
+
+
+def get_rate(allow_stale=True, max_age=None):
+    """使用預設的共用快取取得 10 年期公債利率"""
+    return get_default_cache().get(allow_stale=allow_stale, max_age=max_age)
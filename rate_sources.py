@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+import metrics
+import rate_cache
+
+# 主要來源超過這個時間仍未回應時，同時向備援來源發出請求
+DEFAULT_HEDGE_AFTER = float(os.getenv("RATE_HEDGE_AFTER", "2.0"))
+DEFAULT_DEADLINE = float(os.getenv("RATE_FETCH_DEADLINE", "30"))
+
+
+class RateResult(NamedTuple):
+    value: float
+    source: str
+    degraded: bool = False
+
+
+class CircuitBreaker:
+    """連續失敗達門檻後暫停使用該來源，reset_timeout 後放行一次試探請求"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open":
+                return False
+            if self.state == "half-open":
+                # 只放行一次試探，結果出來前維持 open
+                self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class FredSource:
+    """主要來源：經由 rate_cache 向 FRED 條件式更新"""
+
+    name = "FRED"
+
+    def __init__(self, cache=None):
+        self.cache = cache or rate_cache.get_default_cache()
+
+    def fetch(self):
+        return self.cache.revalidate(self.cache.load())["rate"]
+
+
+class YahooSource:
+    """備援來源：Yahoo Finance 的 ^TNX（10 年期公債殖利率）"""
+
+    name = "Yahoo"
+
+    def __init__(self, ticker="^TNX"):
+        self.ticker = ticker
+
+    def fetch(self):
+        import yfinance
+
+        closes = yfinance.Ticker(self.ticker).history(period="5d")["Close"].dropna()
+        if closes.empty:
+            raise ValueError(f"Yahoo 沒有 {self.ticker} 的報價")
+        return float(closes.iloc[-1])
+
+
+class CachedValueSource:
+    """最後手段：rate_cache.json 裡最後一次取得的值，不論新舊"""
+
+    name = "cache"
+
+    def __init__(self, cache=None):
+        self.cache = cache or rate_cache.get_default_cache()
+
+    def fetch(self):
+        entry = self.cache.load()
+        if entry is None:
+            raise ValueError("沒有可用的快取利率")
+        logging.warning(f"改用快取中的最後利率 ({entry['timestamp']})")
+        return entry["rate"]
+
+
+class HedgedRateFetcher:
+    """
+    依序使用多個來源：主要來源超過 hedge_after 秒未回應或失敗時，平行送出下一個
+    來源的請求，取最先成功的結果。每個來源各自重試並有獨立的斷路器；所有來源都
+    失敗時才使用 fallback，結果標記為 degraded。
+    """
+
+    def __init__(self, sources, fallback=None, hedge_after=DEFAULT_HEDGE_AFTER,
+                 deadline=DEFAULT_DEADLINE, retries=2, backoff=0.5):
+        self.sources = list(sources)
+        self.fallback = fallback
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breakers = {source.name: CircuitBreaker() for source in self.sources}
+        self._pool = ThreadPoolExecutor(max_workers=len(self.sources) or 1)
+
+    def _attempt(self, source):
+        """單一來源的重試迴圈，指數退避；結果回報給該來源的斷路器"""
+        breaker = self.breakers[source.name]
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                value = float(source.fetch())
+                if math.isnan(value):
+                    raise ValueError(f"{source.name} 返回了缺失數據")
+                breaker.record_success()
+                return value
+            except Exception as e:
+                logging.warning(f"{source.name} 第 {attempt + 1} 次請求失敗: {str(e)}")
+                metrics.incr("source_failures")
+                if attempt < self.retries:
+                    metrics.incr("retries")
+                    time.sleep(delay)
+                    delay *= 2
+        breaker.record_failure()
+        raise RuntimeError(f"{source.name} 重試後仍失敗")
+
+    def fetch(self):
+        started = time.monotonic()
+        queue = [s for s in self.sources if self.breakers[s.name].allow()]
+        skipped = len(self.sources) - len(queue)
+        if skipped:
+            logging.warning(f"{skipped} 個來源的斷路器開啟中，暫不使用")
+        pending = {}
+        while queue or pending:
+            if queue and not pending:
+                source = queue.pop(0)
+                pending[self._pool.submit(self._attempt, source)] = source
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                logging.error("取得利率超過時限")
+                break
+            timeout = min(self.hedge_after, remaining) if queue else remaining
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                source = pending.pop(future)
+                if future.exception() is None:
+                    return RateResult(future.result(), source.name)
+            if not done and queue:
+                source = queue.pop(0)
+                logging.info(f"主要來源未在 {self.hedge_after} 秒內回應，同時請求 {source.name}")
+                metrics.incr("hedged_requests")
+                pending[self._pool.submit(self._attempt, source)] = source
+
+        if self.fallback is not None:
+            try:
+                metrics.incr("degraded_results")
+                return RateResult(float(self.fallback.fetch()), self.fallback.name, degraded=True)
+            except Exception as e:
+                logging.error(f"備援快取也無法使用: {str(e)}")
+        return None
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    """FRED 為主、Yahoo ^TNX 為輔、rate_cache.json 為最後手段的 10 年期利率來源"""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            cache = rate_cache.get_default_cache()
+            _default_fetcher = HedgedRateFetcher(
+                [FredSource(cache), YahooSource()],
+                fallback=CachedValueSource(cache)
+            )
+        return _default_fetcher
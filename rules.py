@@ -0,0 +1,268 @@
+import operator
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from subscription_store import CONDITION_GTE, CONDITION_LTE
+
+# 規則語法：比較式以 and / or / not 與括號組合，例如
+#   DGS10 >= 4.5 and DGS2 < 4
+#   DGS10:ma50 > DGS10 or not (DGS10-DGS2 >= 0)
+# 變數可以是一般序列或 indicators.py 的衍生訊號
+COMPARATORS = {
+    ">=": operator.ge, "<=": operator.le, ">": operator.gt,
+    "<": operator.lt, "==": operator.eq, "!=": operator.ne,
+}
+CONDITION_OPERATORS = {CONDITION_GTE: ">=", CONDITION_LTE: "<="}
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<name>[A-Z][A-Z0-9]*(?:-[A-Z][A-Z0-9]*)?(?::[a-z0-9]+)?)
+      | (?P<op>>=|<=|==|!=|>|<)
+      | (?P<paren>[()])
+      | (?P<word>and|or|not)\b
+    )""", re.VERBOSE)
+
+
+class Rule(NamedTuple):
+    shape: str                  # 常數換成 $0、$1… 的結構，相同結構共用編譯結果
+    params: Tuple[float, ...]
+    variables: Tuple[str, ...]
+
+
+def _tokenize(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"無法解析規則，第 {pos + 1} 個字元附近: {text[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match[kind]))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """遞迴下降剖析，產生 ("or"|"and", a, b)、("not", a)、("cmp", op, left, right) 組成的語法樹"""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind, value=None):
+        token = self.peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise ValueError(f"規則語法錯誤：預期 {value or kind}，得到 {token[1]!r}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        tree = self.expression()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"規則語法錯誤：多餘的 {self.peek()[1]!r}")
+        return tree
+
+    def expression(self):
+        tree = self.conjunction()
+        while self.peek() == ("word", "or"):
+            self.pos += 1
+            tree = ("or", tree, self.conjunction())
+        return tree
+
+    def conjunction(self):
+        tree = self.negation()
+        while self.peek() == ("word", "and"):
+            self.pos += 1
+            tree = ("and", tree, self.negation())
+        return tree
+
+    def negation(self):
+        if self.peek() == ("word", "not"):
+            self.pos += 1
+            return ("not", self.negation())
+        if self.peek() == ("paren", "("):
+            self.pos += 1
+            tree = self.expression()
+            self.take("paren", ")")
+            return tree
+        left = self.operand()
+        op = self.take("op")
+        return ("cmp", op, left, self.operand())
+
+    def operand(self):
+        kind, value = self.peek()
+        if kind == "name":
+            self.pos += 1
+            return ("var", value)
+        if kind == "number":
+            self.pos += 1
+            return ("const", float(value))
+        raise ValueError(f"規則語法錯誤：預期序列或數字，得到 {value!r}")
+
+
+def _format(tree, params, variables, top=True):
+    """把語法樹輸出成正規化文字，同時收集常數與變數"""
+    kind = tree[0]
+    if kind == "var":
+        if tree[1] not in variables:
+            variables.append(tree[1])
+        return tree[1]
+    if kind == "const":
+        params.append(tree[1])
+        return f"${len(params) - 1}"
+    if kind == "cmp":
+        return f"{_format(tree[2], params, variables)} {tree[1]} {_format(tree[3], params, variables)}"
+    if kind == "not":
+        return f"not {_format(tree[1], params, variables, False)}"
+    text = f" {kind} ".join(_format(t, params, variables, False) for t in tree[1:])
+    return text if top else f"({text})"
+
+
+def _number(value):
+    # 不用科學記號，正規化後的文字才能再被剖析器辨識
+    return f"{value:.10f}".rstrip("0").rstrip(".")
+
+
+def _fill(shape, params):
+    return re.sub(r"\$(\d+)", lambda m: _number(params[int(m[1])]), shape)
+
+
+@lru_cache(maxsize=65536)
+def parse(text):
+    """剖析規則文字並回傳 Rule；結果依規則文字快取，語法錯誤時拋出 ValueError"""
+    params, variables = [], []
+    shape = _format(_Parser(text).parse(), params, variables)
+    return Rule(shape, tuple(params), tuple(variables))
+
+
+def normalize(text):
+    """規則的正規化文字：空白、括號與數字寫法一致，相同規則只存一份"""
+    rule = parse(text)
+    return _fill(rule.shape, rule.params)
+
+
+def split(text):
+    """把規則拆成 (結構, 常數)；只差在門檻的規則有相同的結構，共用同一份編譯結果"""
+    rule = parse(text)
+    return rule.shape, rule.params
+
+
+class CompiledRule:
+    """同一結構的規則編譯一次：closure 逐條求值，vector 以 NumPy 一次判斷整批常數"""
+
+    def __init__(self, shape):
+        self.shape = shape
+        tree, variables = self._tree(shape)
+        self.variables = tuple(variables)
+        self._closure = self._build_closure(tree)
+        self._vector = self._build_vector(tree)
+
+    @staticmethod
+    def _tree(shape):
+        # 以佔位數字剖析，再把常數節點換成參數索引
+        tree = _Parser(re.sub(r"\$(\d+)", r"\1", shape)).parse()
+        variables = []
+
+        def bind(node):
+            kind = node[0]
+            if kind == "var":
+                if node[1] not in variables:
+                    variables.append(node[1])
+                return node
+            if kind == "const":
+                return ("param", int(node[1]))
+            if kind == "cmp":
+                return ("cmp", node[1], bind(node[2]), bind(node[3]))
+            return (kind,) + tuple(bind(child) for child in node[1:])
+
+        return bind(tree), variables
+
+    def _build_closure(self, node):
+        kind = node[0]
+        if kind == "var":
+            name = node[1]
+            return lambda values, params: values[name]
+        if kind == "param":
+            index = node[1]
+            return lambda values, params: params[index]
+        if kind == "cmp":
+            compare, left, right = COMPARATORS[node[1]], self._build_closure(node[2]), self._build_closure(node[3])
+            return lambda values, params: compare(left(values, params), right(values, params))
+        if kind == "not":
+            inner = self._build_closure(node[1])
+            return lambda values, params: not inner(values, params)
+        first, second = self._build_closure(node[1]), self._build_closure(node[2])
+        if kind == "and":
+            return lambda values, params: first(values, params) and second(values, params)
+        return lambda values, params: first(values, params) or second(values, params)
+
+    def _build_vector(self, node):
+        kind = node[0]
+        if kind == "var":
+            name = node[1]
+            return lambda values, params: values[name]
+        if kind == "param":
+            index = node[1]
+            return lambda values, params: params[:, index]
+        if kind == "cmp":
+            compare, left, right = COMPARATORS[node[1]], self._build_vector(node[2]), self._build_vector(node[3])
+            return lambda values, params: np.broadcast_to(
+                compare(left(values, params), right(values, params)), (len(params),)
+            )
+        if kind == "not":
+            inner = self._build_vector(node[1])
+            return lambda values, params: ~inner(values, params)
+        first, second = self._build_vector(node[1]), self._build_vector(node[2])
+        combine = np.logical_and if kind == "and" else np.logical_or
+        return lambda values, params: combine(first(values, params), second(values, params))
+
+    def __call__(self, values, params):
+        """單條規則求值；缺少任何變數時視為不成立"""
+        if any(name not in values for name in self.variables):
+            return False
+        return bool(self._closure(values, params))
+
+    def vector(self, values, params):
+        """params 為 (規則數, 常數數) 的陣列，回傳每條規則是否成立的布林陣列"""
+        if any(name not in values for name in self.variables):
+            return np.zeros(len(params), dtype=bool)
+        return self._vector(values, params)
+
+
+@lru_cache(maxsize=4096)
+def compile_shape(shape):
+    return CompiledRule(shape)
+
+
+def referenced_series(shapes):
+    """多個規則結構引用到的所有序列與衍生訊號"""
+    names = {}
+    for shape in dict.fromkeys(shapes):
+        names.update(dict.fromkeys(compile_shape(shape).variables))
+    return list(names)
+
+
+PARAM_DTYPE = np.dtype("<f8")
+
+
+def pack(params):
+    """常數以 float64 二進位儲存，整批讀回時串接後 np.frombuffer 即可，不需逐條轉型"""
+    return np.asarray(params, dtype=PARAM_DTYPE).tobytes()
+
+
+def evaluate(shape, packed_params, values):
+    """
+    依目前數值判斷同一結構的整批規則，packed_params 為各規則 pack 後的常數，
+    回傳對齊的布林陣列。結構只編譯一次，常數串接成 (規則數, 常數數) 的陣列後
+    以一次 NumPy 運算判斷整批。
+    """
+    width = shape.count("$")
+    params = np.frombuffer(b"".join(packed_params), dtype=PARAM_DTYPE).reshape(len(packed_params), width)
+    return compile_shape(shape).vector(values, params)
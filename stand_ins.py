@@ -0,0 +1,125 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FredHandler(_Handler):
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        url = urlparse(self.path)
+        with server.lock:
+            server.request_count += 1
+            server.paths.append(url.path)
+        if random.random() < server.error_rate:
+            self._reply(500, {"error_message": "stand-in failure"})
+            return
+        series_id = parse_qs(url.query).get("series_id", ["DGS10"])[0]
+        rate = server.rates.get(series_id, server.default_rate)
+        if url.path.endswith("/series/observations"):
+            observations = server.observations.get(series_id)
+            if observations is None:
+                observations = [(server.date, str(rate))]
+            self._reply(200, {"observations": [
+                {"realtime_start": server.date, "date": date, "value": value} for date, value in observations
+            ]})
+        elif url.path.endswith("/series"):
+            self._reply(200, {"seriess": [
+                {"id": series_id, "realtime_start": server.date, "last_updated": server.last_updated}
+            ]})
+        else:
+            self._reply(404, {"error_message": "unknown path"})
+
+
+class _SendGridHandler(_Handler):
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests.append((self.path, payload) if server.keep_payloads else (self.path, None))
+            server.recipient_count += sum(len(p["to"]) for p in payload.get("personalizations", []))
+        if self.path != "/v3/mail/send":
+            self._reply(404)
+        elif random.random() < server.error_rate:
+            self._reply(500, {"errors": [{"message": "stand-in failure"}]})
+        else:
+            self._reply(server.status)
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FredStandIn(_StandIn):
+    """
+    回應 /fred/series 與 /fred/series/observations，可設定延遲與錯誤率。
+    observations 可指定序列回傳的 [(日期, 值), ...]（新到舊，'.' 表示缺失）
+    """
+
+    def __init__(self, rate=4.5, rates=None, latency=0.0, error_rate=0.0,
+                 date="2025-01-02", last_updated="2025-01-02 15:16:00-06", observations=None):
+        super().__init__(_FredHandler)
+        self.default_rate = rate
+        self.rates = rates or {}
+        self.observations = observations or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.date = date
+        self.last_updated = last_updated
+        self.request_count = 0
+        self.paths = []
+
+    @property
+    def base_url(self):
+        return f"{self.url}/fred"
+
+
+class SendGridStandIn(_StandIn):
+    """/v3/mail/send 的收信端，記錄請求與收件人數"""
+
+    def __init__(self, status=202, latency=0.0, error_rate=0.0, keep_payloads=True):
+        super().__init__(_SendGridHandler)
+        self.status = status
+        self.latency = latency
+        self.error_rate = error_rate
+        self.keep_payloads = keep_payloads
+        self.requests = []
+        self.recipient_count = 0
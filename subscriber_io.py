@@ -0,0 +1,172 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import re
+import sys
+from itertools import islice
+from pathlib import Path
+
+import log_setup
+import rules
+from subscription_store import CONDITION_EXPRESSION, CONDITIONS, DEFAULT_SERIES_ID, SubscriptionStore
+
+EMAIL_PATTERN = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+DEFAULT_BATCH_SIZE = 10000
+FIELDS = ["email", "target_rate", "condition", "series_id", "locale", "rule", "state", "created_at"]
+FORMATS = ("csv", "jsonl")
+
+
+def is_valid_email(email):
+    return EMAIL_PATTERN.match(email) is not None
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix == "csv":
+        return "csv"
+    raise ValueError(f"無法由副檔名判斷格式，請指定 --format: {path}")
+
+
+def read_records(f, fmt):
+    """逐列讀取 CSV 或 JSONL，回傳 dict 的產生器，不會一次讀入整個檔案"""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"不支援的格式: {fmt}")
+
+
+def to_row(record):
+    """
+    把一筆匯入資料轉成 SubscriptionStore.add_many 的列；資料不正確時拋出 ValueError。
+    有 rule 欄位（或 condition 為 expression）時視為規則語法的訂閱。
+    """
+    email = (record.get("email") or "").strip()
+    if not is_valid_email(email):
+        raise ValueError(f"email 格式不正確: {email!r}")
+    locale = record.get("locale") or "zh"
+    rule = record.get("rule") or (record.get("series_id") if record.get("condition") == CONDITION_EXPRESSION else None)
+    if rule:
+        text = rules.normalize(rule)
+        shape, params = rules.split(text)
+        return (email, params[0] if params else 0.0, CONDITION_EXPRESSION, text, locale,
+                shape, rules.pack(params))
+    condition = record.get("condition")
+    if condition not in CONDITIONS:
+        raise ValueError(f"不支援的條件: {condition!r}")
+    return (email, float(record["target_rate"]), condition,
+            record.get("series_id") or DEFAULT_SERIES_ID, locale)
+
+
+def import_records(store, records, batch_size=DEFAULT_BATCH_SIZE, on_progress=None):
+    """
+    分批驗證並寫入，每批一個交易；記憶體用量只與 batch_size 有關。
+    同一批內重複的規則先在記憶體去除，跨批與既有資料的重複由唯一索引略過。
+    回傳 {"read", "imported", "duplicates", "invalid"}。
+    """
+    stats = {"read": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        rows = {}
+        for position, record in enumerate(batch, start=stats["read"] + 1):
+            try:
+                row = to_row(record)
+            except (KeyError, TypeError, ValueError) as e:
+                stats["invalid"] += 1
+                if stats["invalid"] <= 10:
+                    logging.warning(f"第 {position} 筆資料略過: {str(e)}")
+                continue
+            # 唯一索引的欄位：email、series_id、condition、target_rate
+            rows.setdefault((row[0], row[3], row[2], row[1]), row)
+        added = store.add_many(rows.values())
+        stats["read"] += len(batch)
+        stats["imported"] += added
+        stats["duplicates"] = stats["read"] - stats["imported"] - stats["invalid"]
+        if on_progress is not None:
+            on_progress(stats)
+    if stats["invalid"] > 10:
+        logging.warning(f"另有 {stats['invalid'] - 10} 筆格式錯誤未列出")
+    return stats
+
+
+def export_records(store, f, fmt, batch_size=DEFAULT_BATCH_SIZE, **filters):
+    """以 id 游標分批讀出並寫入 CSV 或 JSONL，回傳匯出筆數"""
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+    exported, after_id = 0, 0
+    while True:
+        page = store.search(after_id=after_id, limit=batch_size, **filters)
+        if not page:
+            break
+        for sub_id, email, series_id, target_rate, condition, locale, state, created_at in page:
+            expression = condition == CONDITION_EXPRESSION
+            record = {
+                "email": email, "target_rate": target_rate, "condition": condition,
+                "series_id": "" if expression else series_id, "locale": locale,
+                "rule": series_id if expression else "", "state": state, "created_at": created_at,
+            }
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        exported += len(page)
+        after_id = page[-1][0]
+    return exported
+
+
+def _open(path, mode):
+    if path == "-":
+        stream = sys.stdin if "r" in mode else sys.stdout
+        return io.TextIOWrapper(stream.buffer, encoding="utf-8", newline=""), False
+    return open(path, mode, encoding="utf-8", newline=""), True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批次匯入或匯出訂閱者（CSV / JSONL）")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="檔案路徑，- 表示標準輸入/輸出")
+    parser.add_argument("--format", choices=FORMATS, help="預設依副檔名判斷")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--email", help="匯出時只匯出 email 以此開頭的訂閱者")
+    parser.add_argument("--series-id", help="匯出時只匯出指定序列")
+    parser.add_argument("--state", help="匯出時只匯出指定狀態（armed / fired / cooldown）")
+    args = parser.parse_args(argv)
+
+    log_setup.configure()
+    fmt = args.format or detect_format(args.path)
+    store = SubscriptionStore()
+    f, close = _open(args.path, "r" if args.command == "import" else "w")
+    try:
+        if args.command == "import":
+            stats = import_records(
+                store, read_records(f, fmt), args.batch_size,
+                on_progress=lambda s: logging.info(f"已讀取 {s['read']} 列，新增 {s['imported']}")
+            )
+            logging.info(f"匯入完成: 讀取 {stats['read']}，新增 {stats['imported']}，"
+                         f"重複 {stats['duplicates']}，格式錯誤 {stats['invalid']}")
+        else:
+            count = export_records(store, f, fmt, args.batch_size,
+                                   email=args.email, series_id=args.series_id, state=args.state)
+            logging.info(f"匯出 {count} 筆規則")
+    finally:
+        if close:
+            f.close()
+        else:
+            f.flush()
+            f.detach()
+
+
+if __name__ == "__main__":
+    main()
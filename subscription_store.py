@@ -0,0 +1,336 @@
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+DEFAULT_DB_PATH = Path(os.getenv("SUBSCRIPTIONS_DB", Path(__file__).with_name("subscriptions.db")))
+DEFAULT_SERIES_ID = "DGS10"
+
+CONDITION_GTE = "greater than or equal to"
+CONDITION_LTE = "less than or equal to"
+CONDITIONS = (CONDITION_GTE, CONDITION_LTE)
+# 以規則語法（rules.py）表示的條件；series_id 欄位存放正規化後的規則文字
+CONDITION_EXPRESSION = "expression"
+
+# 通知摘要的時間窗：同一收件人在時間窗內觸發的通知合併成一封
+DIGEST_IMMEDIATE = "immediate"
+DIGEST_HOURLY = "hourly"
+DIGEST_DAILY = "daily"
+DIGEST_WINDOWS = (DIGEST_IMMEDIATE, DIGEST_HOURLY, DIGEST_DAILY)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    series_id TEXT NOT NULL DEFAULT 'DGS10',
+    target_rate REAL NOT NULL,
+    condition TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'armed',
+    fired_at TEXT,
+    cooldown_until TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    locale TEXT NOT NULL DEFAULT 'zh',
+    UNIQUE (email, series_id, condition, target_rate)
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_threshold
+    ON subscriptions (series_id, condition, target_rate);
+-- 收件人層級的設定；沒有設定的收件人使用 Outbox 的預設時間窗
+CREATE TABLE IF NOT EXISTS digest_preferences (
+    email TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+"""
+
+# 後來新增的欄位（舊資料庫開啟時自動補上）與對應索引
+ADDED_COLUMNS = {
+    "state": "TEXT NOT NULL DEFAULT 'armed'",
+    "fired_at": "TEXT",
+    "cooldown_until": "TEXT",
+    "version": "INTEGER NOT NULL DEFAULT 0",
+    "locale": "TEXT NOT NULL DEFAULT 'zh'",
+    # 規則語法的訂閱在新增時就拆好結構與常數，評估時不必逐條剖析
+    "rule_shape": "TEXT",
+    "rule_params": "BLOB",
+    "shard_key": "INTEGER",
+}
+STATE_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_subscriptions_state_threshold
+    ON subscriptions (series_id, condition, state, target_rate);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_cooldown
+    ON subscriptions (state, cooldown_until);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_expression
+    ON subscriptions (state, rule_shape) WHERE condition = 'expression';
+"""
+
+
+def shard_key(email):
+    """依 email 決定的分片鍵；同一位訂閱者的所有規則落在同一個分片"""
+    return zlib.crc32(email.strip().lower().encode("utf-8"))
+
+
+def parse_shard(text):
+    """解析 "i/N" 形式的分片參數，回傳 (i, N)"""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"分片格式應為 i/N: {text}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片編號超出範圍: {text}")
+    return index, count
+
+
+def shard_clause(shard, column="shard_key"):
+    """限定在某個分片的 SQL 條件；shard 為 None 時不限定"""
+    if shard is None:
+        return ""
+    index, count = shard
+    return f" AND {column} % {int(count)} = {int(index)}"
+
+
+def _row_options(rest, defaults=("zh", None, None)):
+    return tuple(rest) + defaults[len(rest):]
+
+
+def _search_filters(email, series_id, state):
+    where, params = "", []
+    if email:
+        # 前綴比對改寫成範圍條件，才能用上以 email 開頭的唯一索引
+        where += " AND email >= ? AND email < ?"
+        params += [email, email + "\uffff"]
+    if series_id:
+        where += " AND series_id = ?"
+        params.append(series_id)
+    if state:
+        where += " AND state = ?"
+        params.append(state)
+    return where, params
+
+
+class VersionConflictError(Exception):
+    """規則在讀取後已被其他人修改（樂觀鎖版本不符）"""
+
+
+class Subscription(NamedTuple):
+    id: int
+    email: str
+    series_id: str
+    target_rate: float
+    condition: str
+    locale: str = "zh"
+    version: int = 0
+
+
+# Subscription 前六個欄位對應的 SELECT 欄位
+COLUMNS = "id, email, series_id, target_rate, condition, locale"
+
+
+class SubscriptionStore:
+    """以 SQLite 保存多位訂閱者的通知規則"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = Path(path)
+        with self.connect() as conn:
+            # WAL 讓讀取不會被寫入擋住，多個寫入者則依 busy_timeout 排隊
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(subscriptions)")}
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE subscriptions ADD COLUMN {column} {definition}")
+            if "shard_key" not in existing:
+                conn.create_function("shard_key", 1, shard_key, deterministic=True)
+                conn.execute("UPDATE subscriptions SET shard_key = shard_key(email)")
+            conn.executescript(STATE_SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, email, target_rate, condition, series_id=DEFAULT_SERIES_ID, locale="zh"):
+        """新增一條規則，相同規則已存在時不重複寫入；回傳是否為新規則"""
+        if condition not in CONDITIONS:
+            raise ValueError(f"不支援的條件: {condition}")
+        return self._insert(email, series_id, target_rate, condition, locale)
+
+    def add_expression(self, email, expression, locale="zh"):
+        """
+        新增一條規則語法的訂閱，例如 "DGS10 >= 4.5 and DGS2 < 4"；語法錯誤時拋出
+        ValueError。target_rate 記錄第一個門檻，僅供通知內容顯示。
+        """
+        import rules  # rules 依賴本模組的常數
+
+        text = rules.normalize(expression)
+        shape, params = rules.split(text)
+        return self._insert(email, text, params[0] if params else 0.0, CONDITION_EXPRESSION, locale,
+                            shape, rules.pack(params))
+
+    def _insert(self, email, series_id, target_rate, condition, locale, rule_shape=None, rule_params=None):
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO subscriptions"
+                " (email, series_id, target_rate, condition, created_at, locale, rule_shape, rule_params,"
+                "  shard_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (email, series_id, float(target_rate), condition, datetime.now().isoformat(), locale,
+                 rule_shape, rule_params, shard_key(email))
+            )
+            return cursor.rowcount == 1
+
+    def add_many(self, rows):
+        """
+        批次新增 (email, target_rate, condition, series_id[, locale[, rule_shape, rule_params]])
+        規則，在同一個交易內寫入，回傳實際新增筆數（已存在的規則略過）
+        """
+        now = datetime.now().isoformat()
+        with self.connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO subscriptions"
+                " (email, series_id, target_rate, condition, created_at, locale, rule_shape, rule_params,"
+                "  shard_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((email, series_id, float(target_rate), condition, now, *_row_options(rest), shard_key(email))
+                 for email, target_rate, condition, series_id, *rest in rows)
+            )
+            return conn.total_changes - before
+
+    def get(self, subscription_id):
+        """讀取單一規則（含版本號），不存在時回傳 None"""
+        with self.connect() as conn:
+            row = conn.execute(
+                f"SELECT {COLUMNS}, version FROM subscriptions WHERE id = ?",
+                (subscription_id,)
+            ).fetchone()
+        return Subscription(*row) if row else None
+
+    def update(self, subscription_id, expected_version, target_rate=None, condition=None):
+        """
+        以樂觀鎖更新規則：只有版本號仍為 expected_version 時才寫入並把版本加一，
+        否則拋出 VersionConflictError，由呼叫端重新讀取後再試。
+        """
+        if condition is not None and condition not in CONDITIONS:
+            raise ValueError(f"不支援的條件: {condition}")
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE subscriptions SET"
+                " target_rate = COALESCE(?, target_rate),"
+                " condition = COALESCE(?, condition),"
+                " version = version + 1"
+                " WHERE id = ? AND version = ?",
+                (None if target_rate is None else float(target_rate), condition,
+                 subscription_id, expected_version)
+            )
+            if cursor.rowcount == 0:
+                raise VersionConflictError(f"規則 {subscription_id} 已被修改或刪除")
+        return expected_version + 1
+
+    def remove(self, subscription_id):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
+
+    def set_digest(self, email, window):
+        """設定收件人的摘要時間窗（immediate / hourly / daily）"""
+        if window not in DIGEST_WINDOWS:
+            raise ValueError(f"不支援的摘要時間窗: {window}")
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO digest_preferences (email, digest) VALUES (?, ?)"
+                " ON CONFLICT (email) DO UPDATE SET digest = excluded.digest",
+                (email, window)
+            )
+
+    def digest(self, email):
+        """收件人設定的摘要時間窗，沒有設定時回傳 None"""
+        with self.connect() as conn:
+            row = conn.execute("SELECT digest FROM digest_preferences WHERE email = ?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, shard=None):
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM subscriptions WHERE 1" + shard_clause(shard)).fetchone()[0]
+
+    def search(self, email=None, series_id=None, state=None, after_id=0, limit=50):
+        """
+        依條件分頁讀取規則，以 id 作為游標（keyset pagination），翻到後面的頁面
+        也不需要掃過前面的資料。email 為前綴比對。
+        """
+        where, params = _search_filters(email, series_id, state)
+        with self.connect() as conn:
+            return conn.execute(
+                f"SELECT {COLUMNS}, state, created_at FROM subscriptions"
+                f" WHERE id > ?{where} ORDER BY id LIMIT ?",
+                (after_id, *params, limit)
+            ).fetchall()
+
+    def count_matching(self, email=None, series_id=None, state=None):
+        where, params = _search_filters(email, series_id, state)
+        with self.connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM subscriptions WHERE 1{where}", params).fetchone()[0]
+
+    def latest(self):
+        """最近一次新增的規則，沒有任何規則時回傳 None"""
+        with self.connect() as conn:
+            row = conn.execute(
+                f"SELECT {COLUMNS}, version FROM subscriptions ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        return Subscription(*row) if row else None
+
+    def iter_sorted(self, series_id, condition):
+        """依 target_rate 由小到大走訪指定序列與條件的規則（走 threshold 索引）"""
+        with self.connect() as conn:
+            cursor = conn.execute(
+                f"SELECT {COLUMNS}, version FROM subscriptions"
+                " WHERE series_id = ? AND condition = ? ORDER BY target_rate, id",
+                (series_id, condition)
+            )
+            for row in cursor:
+                yield Subscription(*row)
+
+    def thresholds(self, series_id, limit=20):
+        """指定序列中最多人設定的幾個目標利率，供圖表疊加參考線"""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT target_rate, condition, COUNT(*) AS n FROM subscriptions"
+                " WHERE series_id = ? GROUP BY target_rate, condition ORDER BY n DESC LIMIT ?",
+                (series_id, limit)
+            ).fetchall()
+        return [(target_rate, condition, n) for target_rate, condition, n in rows]
+
+    def series_ids(self):
+        """一般規則使用的序列（不含規則語法的訂閱）"""
+        with self.connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT series_id FROM subscriptions WHERE condition != ?", (CONDITION_EXPRESSION,)
+            )]
+
+    def rule_shapes(self):
+        """規則語法訂閱中所有不重複的規則結構"""
+        with self.connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT rule_shape FROM subscriptions WHERE condition = ?", (CONDITION_EXPRESSION,)
+            )]
+
+    def migrate_config_json(self, config_path="config.json"):
+        """把舊版單一使用者的 config.json 匯入資料庫，回傳是否有匯入"""
+        config_path = Path(config_path)
+        if not config_path.exists():
+            return False
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        if not config.get("email"):
+            return False
+        added = self.add(config["email"], config["target_rate"], config["condition"])
+        if added:
+            logging.info(f"已從 {config_path} 匯入訂閱者 {config['email']}")
+        return added
+
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from alert_state import ARMED, COOLDOWN, FIRED, AlertStateMachine
+from subscription_store import CONDITION_GTE, CONDITION_LTE, SubscriptionStore
+
+START = datetime(2026, 1, 5, 16, 30)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add("gte@example.com", 4.5, CONDITION_GTE)
+    store.add("lte@example.com", 4.0, CONDITION_LTE)
+    return store
+
+
+def states(store):
+    return {row[1]: row[6] for row in store.search()}
+
+
+def step(machine, rate, hours):
+    return [s.email for s in machine.advance("DGS10", rate, now=START + timedelta(hours=hours))]
+
+
+def test_fires_only_on_crossing(store):
+    machine = AlertStateMachine(store, hysteresis=0.05, cooldown=timedelta(hours=24))
+
+    assert step(machine, 4.4, 0) == []
+    assert step(machine, 4.5, 1) == ["gte@example.com"]
+    assert states(store)["gte@example.com"] == FIRED
+    # 條件持續成立不重複通知
+    assert step(machine, 4.7, 2) == []
+
+
+def test_stays_fired_inside_hysteresis_band(store):
+    machine = AlertStateMachine(store, hysteresis=0.05, cooldown=timedelta(0))
+    step(machine, 4.5, 0)
+
+    # 4.47 只回落到門檻以下 0.03，仍在 band 內
+    assert step(machine, 4.47, 1) == []
+    assert states(store)["gte@example.com"] == FIRED
+    assert step(machine, 4.52, 2) == []
+
+
+def test_rearms_after_clearing_band(store):
+    machine = AlertStateMachine(store, hysteresis=0.05, cooldown=timedelta(0))
+    step(machine, 4.5, 0)
+
+    assert step(machine, 4.44, 1) == []
+    assert states(store)["gte@example.com"] == ARMED
+    assert step(machine, 4.5, 2) == ["gte@example.com"]
+
+
+def test_cooldown_blocks_refire_until_it_expires(store):
+    machine = AlertStateMachine(store, hysteresis=0.05, cooldown=timedelta(hours=24))
+    step(machine, 4.5, 0)
+
+    step(machine, 4.3, 1)
+    assert states(store)["gte@example.com"] == COOLDOWN
+    assert step(machine, 4.6, 2) == []
+    assert step(machine, 4.6, 25) == ["gte@example.com"]
+
+
+def test_lte_rules_use_the_mirrored_band(store):
+    machine = AlertStateMachine(store, hysteresis=0.05, cooldown=timedelta(0))
+
+    assert step(machine, 3.9, 0) == ["lte@example.com"]
+    assert step(machine, 4.03, 1) == []
+    assert states(store)["lte@example.com"] == FIRED
+    step(machine, 4.06, 2)
+    assert states(store)["lte@example.com"] == ARMED
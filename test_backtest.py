@@ -0,0 +1,26 @@
+import numpy as np
+
+from backtest import run_backtest, summarize
+
+
+def test_small_history_matches_hand_count():
+    dates = ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-06", "2025-01-07", "2025-01-08"]
+    values = [4.0, 4.5, np.nan, 5.0, 4.2, 4.8]
+    # >= 4.6、<= 4.3、>= 6.0（從未達成）
+    result = run_backtest(dates, values, [4.6, 4.3, 6.0], [True, False, True])
+
+    assert [str(d) for d in result.dates] == ["2025-01-01", "2025-01-02", "2025-01-06", "2025-01-07", "2025-01-08"]
+    assert [str(d) for d in result.first_trigger] == ["2025-01-06", "2025-01-01", "NaT"]
+    assert result.trigger_days.tolist() == [2, 2, 0]
+    # 第一天即成立也算一次穿越
+    assert result.crossings.tolist() == [2, 2, 0]
+    assert result.daily_emails.tolist() == [1, 0, 1, 1, 1]
+    assert summarize(result) == {
+        "rules": 3,
+        "days": 5,
+        "rules_ever_triggered": 2,
+        "emails_daily_resend": 4,
+        "emails_on_crossing": 4,
+        "peak_daily_emails": 1,
+        "mean_daily_emails": 0.8,
+    }
@@ -0,0 +1,79 @@
+import logging
+
+import pytest
+
+from email_sender import EmailSender
+from stand_ins import SendGridStandIn
+
+
+@pytest.fixture
+def sink():
+    server = SendGridStandIn().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def sender(sink, monkeypatch):
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+    monkeypatch.setenv("SENDGRID_FROM_EMAIL", "alerts@example.com")
+    return EmailSender(host=sink.url)
+
+
+def test_bulk_send_packs_personalizations(sink, sender):
+    recipients = [(f"user{i}@example.com", {"-target_rate-": i}) for i in range(2500)]
+
+    results = sender.send_bulk(recipients, "利率通知", "目標利率：-target_rate-%", max_concurrency=3)
+
+    assert len(results) == 2500
+    assert all(results.values())
+    assert all(path == "/v3/mail/send" for path, _ in sink.requests)
+    sizes = sorted(len(payload["personalizations"]) for _, payload in sink.requests)
+    assert sizes == [500, 1000, 1000]
+    personalizations = [p for _, payload in sink.requests for p in payload["personalizations"]]
+    first = next(p for p in personalizations if p["to"][0]["email"] == "user7@example.com")
+    assert first["substitutions"] == {"-target_rate-": "7"}
+
+
+def test_bulk_send_reports_failed_batches(sink, sender):
+    sink.status = 500
+
+    results = sender.send_bulk(["a@example.com", "b@example.com"], "subject", "body")
+
+    assert results == {"a@example.com": False, "b@example.com": False}
+
+
+def test_failed_requests_are_summarized_once(sink, sender, caplog):
+    sink.status = 500
+
+    with caplog.at_level(logging.INFO):
+        sender.send_bulk(["a@example.com", "b@example.com", "c@example.com"], "subject", "body", batch_size=1)
+
+    summary, failure = [r for r in caplog.records if r.event in ("bulk_send", "bulk_send_failed")]
+    assert summary.getMessage() == "Bulk send finished: 0/3 recipients in 3 requests"
+    assert failure.levelno == logging.ERROR and failure.getMessage().startswith("3 requests failed: ")
+    assert sum(failure.failures.values()) == 3 and "(x3)" in failure.getMessage()
+
+
+def test_client_is_reused(sender):
+    assert sender.client is sender.client
+
+
+def test_groups_share_requests_through_sections(sink, sender):
+    groups = [
+        (f"subject {g}", f"text {g} -email-", f"<p>html {g}</p>", [f"g{g}u{i}@example.com" for i in range(3)])
+        for g in range(4)
+    ]
+
+    results = sender.send_groups(groups, batch_size=5)
+
+    assert len(results) == 12 and all(results.values())
+    assert len(sink.requests) == 3
+    # 批次並行送出，依收件人找出第一批而不是依抵達順序
+    payload = next(p for _, p in sink.requests
+                   if p["personalizations"][0]["to"][0]["email"] == "g0u0@example.com")
+    assert payload["content"][0]["value"] == "-alert_text-"
+    first = payload["personalizations"][0]
+    assert first["subject"] == "subject 0"
+    assert payload["sections"][first["substitutions"]["-alert_text-"]] == "text 0 -email-"
+    assert payload["sections"][first["substitutions"]["-alert_html-"]] == "<p>html 0</p>"
@@ -0,0 +1,27 @@
+import numpy as np
+
+from downsample import lttb
+
+
+def test_keeps_endpoints_and_requested_length():
+    x = np.arange("2000-01-01", "2001-01-01", dtype="datetime64[D]")
+    y = np.sin(np.arange(len(x)) / 10.0)
+    sampled_x, sampled_y = lttb(x, y, 50)
+    assert len(sampled_x) == len(sampled_y) == 50
+    assert sampled_x[0] == x[0] and sampled_x[-1] == x[-1]
+    assert sampled_y[0] == y[0] and sampled_y[-1] == y[-1]
+    assert np.all(np.diff(sampled_x.astype(np.int64)) > 0)
+
+
+def test_keeps_the_spike():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37] = 10.0
+    _, sampled_y = lttb(x, y, 10)
+    assert sampled_y.max() == 10.0
+
+
+def test_short_series_returned_unchanged():
+    x, y = np.arange(5), np.arange(5.0)
+    sampled_x, sampled_y = lttb(x, y, 10)
+    assert sampled_x.tolist() == x.tolist() and sampled_y.tolist() == y.tolist()
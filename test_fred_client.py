@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from fred_client import FredClient, RateLimiter, TREASURY_CURVE
+from stand_ins import FredStandIn
+
+
+@pytest.fixture
+def fred():
+    fred = FredStandIn(
+        rate=4.5, latency=0.2, rates={"DGS2": 4.2},
+        observations={
+            "DGS10": [("2025-01-03", "."), ("2025-01-02", "4.57")],
+            "MISSING": [("2025-01-03", "."), ("2025-01-02", ".")],
+            "EMPTY": [],
+        },
+    ).start()
+    yield fred
+    fred.stop()
+
+
+def client_for(fred):
+    return FredClient("test", fred.base_url, rate_limiter=RateLimiter(rate=1000, burst=100))
+
+
+def test_latest_observation_skips_missing_values(fred):
+    client = client_for(fred)
+    obs = client.latest_observation("DGS10")
+    assert (obs.date, obs.value) == ("2025-01-02", 4.57)
+    with pytest.raises(ValueError):
+        client.latest_observation("MISSING")
+
+
+def test_fetch_latest_runs_series_concurrently_and_maps_failures_to_none(fred):
+    series_ids = TREASURY_CURVE + ["EMPTY", "MISSING"] + [f"S{i}" for i in range(7)]
+    client = client_for(fred)
+
+    started = time.monotonic()
+    results = client.fetch_latest(series_ids)
+    elapsed = time.monotonic() - started
+
+    assert len(series_ids) == 20 and list(results) == series_ids
+    assert results["DGS2"].value == 4.2 and results["DGS10"].value == 4.57
+    assert results["EMPTY"] is None and results["MISSING"] is None
+    assert fred.request_count == 20
+    # 20 個序列各延遲 0.2 秒，依序請求需要 4 秒；並行時約等於一次請求
+    assert elapsed < 0.2 * 3
+
+
+def test_rate_limiter_paces_after_burst():
+    limiter = RateLimiter(rate=20, burst=2)
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    elapsed = time.monotonic() - started
+    # 前 2 次用掉 burst，其餘 4 次每 1/20 秒一次
+    assert 4 / 20 * 0.9 <= elapsed < 4 / 20 + 0.15
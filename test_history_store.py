@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from history_store import HistoryStore
+
+
+class FakeFred:
+    def __init__(self, observations):
+        self.observations_list = observations
+        self.calls = []
+
+    def observations(self, series_id, offset=0, observation_start=None, **params):
+        self.calls.append(observation_start)
+        return [o for o in self.observations_list
+                if observation_start is None or o["date"] >= observation_start][offset:]
+
+
+def test_append_and_read_round_trip(tmp_path):
+    store = HistoryStore(tmp_path)
+    assert store.append("DGS10", ["2025-01-02", "2025-01-03"], [4.57, 4.60]) == 2
+    assert store.append("DGS10", ["2025-01-06"], [4.62]) == 1
+    dates, values = store.read("DGS10")
+    assert [str(d) for d in dates] == ["2025-01-02", "2025-01-03", "2025-01-06"]
+    assert values.tolist() == [4.57, 4.60, 4.62]
+    assert store.last_date("DGS10") == np.datetime64("2025-01-06")
+    with pytest.raises(ValueError):
+        store.append("DGS10", ["2025-01-06"], [4.70])
+
+
+def test_sync_stores_missing_values_as_nan_and_only_fetches_new_dates(tmp_path):
+    fred = FakeFred([
+        {"date": "2025-01-01", "value": "."},
+        {"date": "2025-01-02", "value": "4.57"},
+    ])
+    store = HistoryStore(tmp_path)
+    assert store.sync("DGS10", client=fred) == 2
+    fred.observations_list.append({"date": "2025-01-03", "value": "4.60"})
+    assert store.sync("DGS10", client=fred) == 1
+    assert fred.calls == [None, "2025-01-03"]
+
+    dates, values = store.read("DGS10")
+    assert [str(d) for d in dates] == ["2025-01-01", "2025-01-02", "2025-01-03"]
+    assert np.isnan(values[0])
+    assert values[1:].tolist() == [4.57, 4.60]
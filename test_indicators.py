@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from indicators import DAYS_52W, IndicatorEngine, is_derived
+
+
+def make_series(n, start=18000, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = start + np.cumsum(rng.integers(1, 4, size=n))
+    values = 4 + np.cumsum(rng.normal(0, 0.05, size=n))
+    values[rng.random(n) < 0.03] = np.nan
+    return dates.astype(np.int64), values
+
+
+def test_parse_keys():
+    assert not is_derived("DGS10")
+    assert all(is_derived(k) for k in ("DGS10:ma50", "DGS10:change", "DGS10:high52w", "DGS10-DGS2"))
+    assert not is_derived("DGS10:ma0")
+    with pytest.raises(ValueError):
+        IndicatorEngine(["DGS10"])
+
+
+def test_matches_full_recompute(tmp_path):
+    dates, values = make_series(1500)
+    engine = IndicatorEngine(["DGS10:ma50", "DGS10:change", "DGS10:high52w", "DGS10:low52w"],
+                             tmp_path / "state.json")
+    engine.update("DGS10", dates, values)
+
+    valid = ~np.isnan(values)
+    d, v = dates[valid], values[valid]
+    in_year = d > d[-1] - DAYS_52W
+    result = engine.values()
+    assert result["DGS10:ma50"] == pytest.approx(v[-50:].mean())
+    assert result["DGS10:change"] == pytest.approx(v[-1] - v[-2])
+    assert result["DGS10:high52w"] == v[in_year].max()
+    assert result["DGS10:low52w"] == v[in_year].min()
+
+
+def test_state_resumes_between_runs(tmp_path):
+    path = tmp_path / "state.json"
+    keys = ["DGS10:ma20", "DGS10:high52w", "DGS10-DGS2"]
+    dates, tens = make_series(800, seed=1)
+    twos = tens - 0.5
+
+    full = IndicatorEngine(keys, tmp_path / "full.json")
+    full.update("DGS10", dates, tens)
+    full.update("DGS2", dates, twos)
+
+    # 分兩次執行，第二次重新載入狀態並重送重疊的資料
+    first = IndicatorEngine(keys, path)
+    first.update("DGS10", dates[:500], tens[:500])
+    first.update("DGS2", dates[:450], twos[:450])
+    first.save()
+    second = IndicatorEngine(keys, path)
+    second.update("DGS10", dates, tens)
+    second.update("DGS2", dates, twos)
+
+    assert second.values() == pytest.approx(full.values())
+    assert second.values()["DGS10-DGS2"] == pytest.approx(0.5)
+
+
+def test_spread_waits_for_both_sides(tmp_path):
+    engine = IndicatorEngine(["DGS10-DGS2"], tmp_path / "state.json")
+    engine.update("DGS10", np.array([1, 2, 3]), np.array([4.0, 4.1, 4.2]))
+    engine.update("DGS2", np.array([1, 2]), np.array([3.5, 3.7]))
+
+    assert engine.values() == {"DGS10-DGS2": pytest.approx(0.4)}
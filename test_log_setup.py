@@ -0,0 +1,90 @@
+import io
+import json
+import logging
+import multiprocessing
+
+import pytest
+
+import log_setup
+
+
+@pytest.fixture
+def output():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+    yield stream
+    log_setup.shutdown()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def lines(stream):
+    log_setup.flush()
+    return stream.getvalue().splitlines()
+
+
+def test_json_output_keeps_extra_fields_and_exception(output):
+    log_setup.configure(fmt="json", stream=output, force=True)
+    logging.info("寄出 %d 封", 3, extra={"event": "bulk_send", "sent": 3})
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logging.error("失敗", exc_info=True)
+
+    first, second = map(json.loads, lines(output))
+    assert first["message"] == "寄出 3 封" and first["event"] == "bulk_send" and first["sent"] == 3
+    assert second["level"] == "ERROR" and "ZeroDivisionError" in second["exception"]
+
+
+def test_sampling_keeps_every_nth_record_below_warning(output):
+    log_setup.configure(stream=output, sample_rates={"noisy": 0.25}, rate_limit=0, force=True)
+    for i in range(10):
+        logging.info(f"info {i}", extra={"event": "noisy"})
+    logging.warning("warning", extra={"event": "noisy"})
+
+    assert [line.split(" - ")[-1] for line in lines(output)] == ["info 0", "info 4", "info 8", "warning"]
+
+
+@pytest.mark.parametrize("rate", [0.4, 0.6, 0.7, 0.9])
+def test_sampling_keeps_the_configured_share(output, rate):
+    log_setup.configure(stream=output, sample_rates={"noisy": rate}, rate_limit=0, force=True)
+    for i in range(1000):
+        logging.info(f"info {i}", extra={"event": "noisy"})
+
+    assert len(lines(output)) == round(1000 * rate)
+
+
+def test_rate_limit_reports_suppressed_records(output):
+    log_setup.configure(stream=output, rate_limit=2, window=3600, force=True)
+    for i in range(5):
+        logging.error(f"error {i}", extra={"event": "send"})
+    log_setup.shutdown()
+
+    messages = [line.split(" - ")[-1] for line in output.getvalue().splitlines()]
+    assert messages == ["error 0", "error 1", "send 另有 3 筆訊息因限速未輸出"]
+
+
+def test_child_can_log_when_fork_happens_while_filter_lock_is_held(output, tmp_path):
+    path = tmp_path / "child.log"
+    with open(path, "w") as stream:
+        log_setup.configure(stream=stream, force=True)
+
+        def child():
+            logging.warning("from child")
+            log_setup.flush()
+
+        # fork 時鎖正被持有，子行程必須換一把新鎖才不會卡住
+        with log_setup._filter._lock:
+            process = multiprocessing.get_context("fork").Process(target=child, daemon=True)
+            process.start()
+        process.join(timeout=10)
+        if process.is_alive():
+            process.kill()
+        log_setup.shutdown()
+
+    assert process.exitcode == 0
+    assert path.read_text().strip().endswith("from child")
@@ -0,0 +1,46 @@
+import json
+
+from metrics import Metrics
+
+
+def test_disabled_registry_records_nothing():
+    metrics = Metrics(path=None)
+    with metrics.span("fetch"):
+        metrics.incr("emails_sent", 3)
+    assert metrics.spans == {} and metrics.counters == {}
+
+
+def test_counters_and_spans_accumulate(tmp_path):
+    metrics = Metrics(tmp_path / "metrics.jsonl")
+    metrics.incr("emails_sent")
+    metrics.incr("emails_sent", 4)
+    for _ in range(3):
+        with metrics.span("send_batch"):
+            pass
+
+    assert metrics.counters == {"emails_sent": 5}
+    count, total, longest = metrics.spans["send_batch"]
+    assert count == 3 and 0 <= longest <= total
+    assert metrics.summary().startswith("send_batch ")
+
+    metrics.write()
+    record = json.loads((tmp_path / "metrics.jsonl").read_text())
+    assert record["counters"] == {"emails_sent": 5}
+    assert record["spans"]["send_batch"]["count"] == 3
+
+
+def test_prometheus_textfile(tmp_path):
+    path = tmp_path / "monitor.prom"
+    metrics = Metrics(path)
+    with metrics.span("evaluation"):
+        metrics.incr("alerts_triggered", 7)
+    metrics.write()
+    metrics.write()
+
+    lines = path.read_text().splitlines()
+    assert "# TYPE monitor_span_seconds gauge" in lines
+    assert 'monitor_span_count{span="evaluation"} 1' in lines
+    assert "monitor_alerts_triggered 7" in lines
+    # 整檔替換，重複寫入不會累加內容，也不留下暫存檔
+    assert lines.count("monitor_alerts_triggered 7") == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["monitor.prom"]
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from alert_state import AlertStateMachine
+from monitor_daemon import (
+    MAX_BACKOFF, POLL_INTERVAL, POLL_WINDOW, RELEASE_TZ, backoff_delay, expected_observation_date,
+    has_new_data, next_window, wait_until
+)
+from outbox import SENT, Outbox
+from subscription_store import CONDITION_GTE, DIGEST_HOURLY, SubscriptionStore
+
+
+def at(day, hour, minute=0):
+    return datetime(2025, 1, day, hour, minute, tzinfo=RELEASE_TZ)
+
+
+def test_window_before_and_during_release():
+    # 2025-01-03 是星期五
+    start = at(3, 16, 15)
+    assert next_window(at(3, 10)) == (start, start + POLL_WINDOW)
+    assert next_window(start) == (start, start + POLL_WINDOW)
+    assert next_window(at(3, 17)) == (at(3, 17), start + POLL_WINDOW)
+
+
+def test_window_moves_past_weekend_when_closed_or_done():
+    monday = at(6, 16, 15)
+    end = at(3, 16, 15) + POLL_WINDOW
+    # 時段結束的那一刻起就算今天已過
+    assert next_window(end) == (monday, monday + POLL_WINDOW)
+    assert next_window(at(3, 17), done_day=date(2025, 1, 3)) == (monday, monday + POLL_WINDOW)
+    assert next_window(at(4, 12)) == (monday, monday + POLL_WINDOW)
+
+
+def test_new_data_requires_the_expected_observation_date():
+    friday, monday = date(2025, 1, 3), date(2025, 1, 6)
+    assert expected_observation_date(friday) == date(2025, 1, 2)
+    assert expected_observation_date(monday) == friday
+    # 快取沒有日期，或發布前的輪詢只把落後的快取更新到更早的資料
+    assert not has_new_data(None, friday)
+    assert not has_new_data("2024-12-27", friday)
+    assert not has_new_data("2025-01-02", monday)
+    assert has_new_data("2025-01-02", friday)
+    assert has_new_data("2025-01-03", monday)
+
+
+def test_backoff_doubles_up_to_cap():
+    assert backoff_delay(0) == POLL_INTERVAL
+    assert backoff_delay(1) == POLL_INTERVAL
+    assert backoff_delay(2) == min(MAX_BACKOFF, POLL_INTERVAL * 2)
+    assert backoff_delay(50) == MAX_BACKOFF
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = []
+
+    def send_groups(self, groups, batch_size=1000, max_concurrency=4):
+        results = {}
+        for _, _, _, recipients in groups:
+            for email, _ in recipients:
+                self.sent.append(email)
+                results[email] = True
+        return results
+
+
+def test_digest_closing_between_windows_is_sent_before_next_window(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_many([("user0@example.com", 4.0, CONDITION_GTE, "DGS10")])
+    store.set_digest("user0@example.com", DIGEST_HOURLY)
+    outbox = Outbox(store)
+    AlertStateMachine(store).advance("DGS10", 4.5, outbox=outbox)
+    # 讓摘要時間窗在 0.2 秒後結束，下一個輪詢時段則在 1 秒後
+    due = datetime.now() + timedelta(seconds=0.2)
+    with store.connect() as conn:
+        conn.execute("UPDATE outbox SET next_attempt_at = ?", (due.isoformat(),))
+    sender = FakeSender()
+    sent_at = []
+
+    def send():
+        outbox.drain(sender)
+        sent_at.append(datetime.now())
+
+    async def wait():
+        wake_at = datetime.now(RELEASE_TZ) + timedelta(seconds=1)
+        stopped = await wait_until(asyncio.Event(), wake_at, outbox, send)
+        return stopped, wake_at
+
+    stopped, wake_at = asyncio.run(wait())
+    assert not stopped
+    assert sender.sent == ["user0@example.com"]
+    assert due <= sent_at[0] < wake_at.astimezone().replace(tzinfo=None)
+    assert outbox.count(SENT) == 1
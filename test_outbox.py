@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from alert_state import AlertStateMachine
+from outbox import DEAD, PENDING, SENDING, SENT, Outbox, digest_due
+from subscription_store import CONDITION_GTE, CONDITION_LTE, DIGEST_DAILY, DIGEST_HOURLY, SubscriptionStore
+
+
+class FakeSender:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.sent = []
+        self.subjects = []
+
+    def send_groups(self, groups, batch_size=1000, max_concurrency=4):
+        results = {}
+        for subject, _, _, recipients in groups:
+            for email, _ in recipients:
+                self.subjects.append((email, subject))
+                results[email] = email not in self.fail
+                if results[email]:
+                    self.sent.append(email)
+        return results
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_many((f"user{i}@example.com", 4.0, CONDITION_GTE, "DGS10") for i in range(5))
+    return store
+
+
+def test_fired_rules_are_queued_once(store):
+    outbox = Outbox(store)
+    machine = AlertStateMachine(store)
+    now = datetime(2026, 1, 5, 16, 30)
+
+    fired = machine.advance("DGS10", 4.5, now=now, outbox=outbox)
+    with store.connect() as conn:
+        duplicates = outbox.enqueue(conn, fired, 4.5, now.isoformat())
+
+    assert len(fired) == 5
+    assert duplicates == 0
+    assert outbox.count(PENDING) == 5
+
+
+def test_drain_retries_then_dead_letters(store):
+    outbox = Outbox(store, max_attempts=2, retry_backoff=0.01)
+    AlertStateMachine(store).advance("DGS10", 4.5, outbox=outbox)
+    sender = FakeSender(fail={"user0@example.com"})
+
+    sent = outbox.drain(sender, wait_for_retries=1.0)
+
+    assert sent == 4
+    assert sorted(sender.sent) == [f"user{i}@example.com" for i in range(1, 5)]
+    assert outbox.count(SENT) == 4
+    assert outbox.count(DEAD) == 1
+    # 之後的執行不再把這筆算成新增的 dead
+    assert outbox.count(DEAD, since=datetime.now().isoformat()) == 0
+
+
+def test_interrupted_send_is_resumed_after_lease(store):
+    outbox = Outbox(store, lease_seconds=60)
+    AlertStateMachine(store).advance("DGS10", 4.5, outbox=outbox)
+    # 模擬寄送途中行程中斷：訊息停在 sending，租約已過期
+    claimed = outbox._claim(3)
+    stale = (datetime.now() - timedelta(minutes=5)).isoformat()
+    with store.connect() as conn:
+        conn.execute("UPDATE outbox SET claimed_at = ?", (stale,))
+    assert len(claimed) == 3 and outbox.count(SENDING) == 3
+
+    sender = FakeSender()
+    assert outbox.drain(sender) == 5
+    assert outbox.count(SENDING) == 0
+    assert len(sender.sent) == 5
+
+
+def test_alerts_for_one_recipient_are_sent_as_one_digest(store):
+    store.add_many([("user0@example.com", 3.0, CONDITION_LTE, "DGS2"),
+                    ("user0@example.com", 4.2, CONDITION_GTE, "DGS10")])
+    outbox = Outbox(store)
+    machine = AlertStateMachine(store)
+    now = datetime(2026, 1, 5, 16, 30)
+    machine.advance("DGS10", 4.5, now=now, outbox=outbox)
+    machine.advance("DGS2", 2.9, now=now, outbox=outbox)
+
+    sender = FakeSender()
+    assert outbox.drain(sender, claim_size=2) == 7
+
+    assert len(sender.subjects) == 5
+    subjects = dict(sender.subjects)
+    assert "3 個條件已達成" in subjects["user0@example.com"]
+    assert "DGS10 已達 4.50%" in subjects["user1@example.com"]
+    assert outbox.count(SENT) == 7
+
+
+def test_digest_window_delays_sending(store):
+    store.set_digest("user0@example.com", DIGEST_HOURLY)
+    outbox = Outbox(store)
+    now = datetime.now()
+    AlertStateMachine(store).advance("DGS10", 4.5, now=now, outbox=outbox)
+
+    assert outbox.drain(FakeSender()) == 4
+    assert outbox.count(PENDING) == 1
+    assert outbox.next_due() == digest_due(DIGEST_HOURLY, now)
+
+
+def test_digest_due_times():
+    taipei = ZoneInfo("Asia/Taipei")
+    now = datetime(2026, 1, 5, 16, 30, tzinfo=taipei)
+    assert digest_due(DIGEST_HOURLY, now, taipei) == datetime(2026, 1, 5, 17, 0, tzinfo=taipei)
+    assert digest_due(DIGEST_DAILY, now, taipei) == datetime(2026, 1, 6, 8, 0, tzinfo=taipei)
+    assert digest_due(DIGEST_DAILY, now.replace(hour=7), taipei) == datetime(2026, 1, 5, 8, 0, tzinfo=taipei)
+    # 10:00 UTC 的排程在台北是 18:00，每日摘要在隔天 08:00（UTC 00:00）寄出
+    utc = datetime(2026, 1, 5, 10, 0, tzinfo=timezone.utc)
+    assert digest_due(DIGEST_DAILY, utc, taipei) == datetime(2026, 1, 6, 0, 0, tzinfo=timezone.utc)
+
+
+def test_scheduled_run_sends_digests_that_close_before_the_next_run(store):
+    store.set_digest("user0@example.com", DIGEST_DAILY)
+    store.set_digest("user1@example.com", DIGEST_HOURLY)
+    outbox = Outbox(store, max_attempts=2, retry_backoff=3600)
+    AlertStateMachine(store).advance("DGS10", 4.5, outbox=outbox)
+
+    sender = FakeSender(fail={"user2@example.com"})
+    assert outbox.drain(sender, send_ahead=24 * 3600) == 4
+    assert "user0@example.com" in sender.sent and "user1@example.com" in sender.sent
+    # 失敗的重試仍依 backoff，不會因為 send_ahead 提前
+    assert outbox.count(PENDING) == 1
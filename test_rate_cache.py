@@ -0,0 +1,72 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from fred_client import FredClient
+from rate_cache import RateCache
+from stand_ins import FredStandIn
+
+LAST_UPDATED = "2025-01-02 15:16:00-06"
+
+
+@pytest.fixture
+def fred():
+    fred = FredStandIn(rate=4.5, last_updated=LAST_UPDATED).start()
+    yield fred
+    fred.stop()
+
+
+@pytest.fixture
+def cache(fred, tmp_path):
+    return RateCache(tmp_path / "rate_cache.json", ttl=60, max_stale=3600,
+                     client=FredClient("test", fred.base_url))
+
+
+def write_entry(cache, age, rate=4.0, last_updated="2025-01-01 15:16:00-06"):
+    timestamp = (datetime.now() - timedelta(seconds=age)).isoformat()
+    with open(cache.path, "w") as f:
+        json.dump({"rate": rate, "timestamp": timestamp, "source": "FRED", "series_id": "DGS10",
+                   "date": "2024-12-31", "last_updated": last_updated}, f)
+
+
+def test_fresh_entry_is_served_without_requests(fred, cache):
+    write_entry(cache, age=10)
+    assert cache.get() == 4.0
+    assert fred.request_count == 0
+
+
+def test_missing_entry_is_fetched_and_stored(fred, cache):
+    assert cache.get() == 4.5
+    assert fred.paths == ["/fred/series", "/fred/series/observations"]
+    entry = cache.load()
+    assert entry["date"] == fred.date and entry["last_updated"] == LAST_UPDATED
+
+
+def test_stale_entry_is_served_while_revalidating_in_background(fred, cache):
+    write_entry(cache, age=120)
+    assert cache.get() == 4.0
+
+    deadline = time.monotonic() + 5
+    while cache.load()["rate"] != 4.5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.load()["rate"] == 4.5
+    assert cache.age(cache.load()) < 60
+
+
+def test_failed_revalidation_falls_back_within_max_stale(fred, cache):
+    fred.error_rate = 1.0
+    write_entry(cache, age=120)
+    assert cache.get(allow_stale=False) == 4.0
+
+    write_entry(cache, age=60 + 3600 + 10)
+    assert cache.get() is None
+
+
+def test_unchanged_last_updated_skips_the_observation_request(fred, cache):
+    write_entry(cache, age=120, last_updated=LAST_UPDATED)
+    assert cache.get(allow_stale=False) == 4.0
+    assert fred.paths == ["/fred/series"]
+    # 只刷新時間戳，接下來的讀取在 TTL 內
+    assert cache.fresh() == 4.0
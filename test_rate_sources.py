@@ -0,0 +1,92 @@
+import time
+
+from rate_sources import CircuitBreaker, HedgedRateFetcher
+
+
+class FakeSource:
+    """可設定延遲與失敗次數的本地假來源"""
+
+    def __init__(self, name, value, delay=0.0, failures=0):
+        self.name = name
+        self.value = value
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise ConnectionError(f"{self.name} unavailable")
+        return self.value
+
+
+def make_fetcher(sources, fallback=None, **kwargs):
+    kwargs.setdefault("hedge_after", 0.05)
+    kwargs.setdefault("deadline", 2.0)
+    kwargs.setdefault("backoff", 0.01)
+    return HedgedRateFetcher(sources, fallback=fallback, **kwargs)
+
+
+def test_primary_answers_within_budget():
+    primary = FakeSource("FRED", 4.5)
+    secondary = FakeSource("Yahoo", 4.4)
+
+    result = make_fetcher([primary, secondary]).fetch()
+
+    assert (result.value, result.source, result.degraded) == (4.5, "FRED", False)
+    assert secondary.calls == 0
+
+
+def test_slow_primary_is_hedged():
+    primary = FakeSource("FRED", 4.5, delay=1.0)
+    secondary = FakeSource("Yahoo", 4.4)
+
+    started = time.monotonic()
+    result = make_fetcher([primary, secondary]).fetch()
+
+    assert result.source == "Yahoo"
+    assert time.monotonic() - started < 0.5
+
+
+def test_retries_with_backoff():
+    primary = FakeSource("FRED", 4.5, failures=2)
+
+    result = make_fetcher([primary], retries=2).fetch()
+
+    assert result.value == 4.5
+    assert primary.calls == 3
+
+
+def test_fallback_when_all_sources_fail():
+    primary = FakeSource("FRED", 4.5, failures=10)
+    secondary = FakeSource("Yahoo", 4.4, failures=10)
+    fallback = FakeSource("cache", 4.2)
+
+    result = make_fetcher([primary, secondary], fallback=fallback, retries=0).fetch()
+
+    assert (result.value, result.source, result.degraded) == (4.2, "cache", True)
+
+
+def test_circuit_breaker_skips_failing_source():
+    primary = FakeSource("FRED", 4.5, failures=100)
+    secondary = FakeSource("Yahoo", 4.4)
+    fetcher = make_fetcher([primary, secondary], retries=0)
+
+    for _ in range(3):
+        assert fetcher.fetch().source == "Yahoo"
+    calls = primary.calls
+    assert fetcher.breakers["FRED"].state == "open"
+    assert fetcher.fetch().source == "Yahoo"
+    assert primary.calls == calls
+
+
+def test_circuit_breaker_half_open_after_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import rules
+from alert_state import AlertStateMachine
+from subscription_store import SubscriptionStore
+
+
+def test_normalize_is_stable():
+    text = rules.normalize("DGS10>=4.50 and(DGS2 < 4 or not DGS10-DGS2 >= -0.25)")
+    assert text == "DGS10 >= 4.5 and (DGS2 < 4 or not DGS10-DGS2 >= -0.25)"
+    assert rules.normalize(text) == text
+    assert rules.split(text) == ("DGS10 >= $0 and (DGS2 < $1 or not DGS10-DGS2 >= $2)", (4.5, 4.0, -0.25))
+
+
+@pytest.mark.parametrize("text", ["DGS10 >=", "DGS10 >= 4 and", "(DGS10 > 1", "DGS10 => 4", "dgs10 > 4"])
+def test_syntax_errors(text):
+    with pytest.raises(ValueError):
+        rules.parse(text)
+
+
+def test_vector_matches_closure():
+    rng = np.random.default_rng(0)
+    texts = [rules.normalize(f"DGS10 >= {a:.2f} and (DGS2 < {b:.2f} or not DGS10:ma50 > {c:.2f})")
+             for a, b, c in rng.uniform(3, 6, size=(500, 3))]
+    values = {"DGS10": 4.5, "DGS2": 4.1, "DGS10:ma50": 4.3}
+
+    shapes, params = zip(*map(rules.split, texts))
+
+    result = rules.evaluate(shapes[0], [rules.pack(p) for p in params], values)
+
+    expected = [rules.compile_shape(shape)(values, p) for shape, p in zip(shapes, params)]
+    assert result.tolist() == expected
+    assert 0 < result.sum() < len(texts)
+    # 500 條規則只有一種結構
+    assert len(set(shapes)) == 1
+
+
+def test_missing_series_never_matches():
+    shape, params = rules.split("DGS10 >= 1 or not DGS2 > 100")
+    assert rules.evaluate(shape, [rules.pack(params)], {"DGS10": 4.5}).tolist() == [False]
+
+
+def test_expression_subscriptions_fire_once(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    assert store.add_expression("a@example.com", "DGS10 >= 4.5 and DGS2 < 4")
+    assert not store.add_expression("a@example.com", "DGS10>=4.50 and DGS2<4")
+    store.add_expression("b@example.com", "DGS10 >= 5")
+    assert store.series_ids() == []
+    assert rules.referenced_series(store.rule_shapes()) == ["DGS10", "DGS2"]
+
+    machine = AlertStateMachine(store)
+    fired = machine.advance_expressions({"DGS10": 4.6, "DGS2": 3.9})
+    assert [s.email for s in fired] == ["a@example.com"]
+    assert machine.advance_expressions({"DGS10": 4.7, "DGS2": 3.9}) == []
+
+
+def test_missing_series_keeps_fired_rules_fired(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_expression("a@example.com", "DGS10 >= 4.5 and DGS2 < 4")
+    machine = AlertStateMachine(store, cooldown=timedelta(0))
+    day = datetime(2026, 1, 5, 16, 30)
+
+    assert len(machine.advance_expressions({"DGS10": 4.6, "DGS2": 3.9}, now=day)) == 1
+    # DGS2 取得失敗的那天不能把規則重新 armed，否則隔天會再通知一次
+    assert machine.advance_expressions({"DGS10": 4.6}, now=day + timedelta(days=1)) == []
+    assert machine.advance_expressions({"DGS10": 4.6, "DGS2": 3.9}, now=day + timedelta(days=2)) == []
+    assert store.search()[0][6] == "fired"
@@ -0,0 +1,77 @@
+import pytest
+
+from fred_client import FredClient
+from rate_cache import RateCache
+from stand_ins import FredStandIn, SendGridStandIn
+from subscription_store import CONDITION_GTE, SubscriptionStore, parse_shard, shard_clause
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    fred = FredStandIn(rate=4.5).start()
+    sendgrid = SendGridStandIn().start()
+    monkeypatch.setenv("FRED_API_KEY", "test")
+    monkeypatch.setenv("FRED_BASE_URL", fred.base_url)
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+    monkeypatch.setenv("SENDGRID_FROM_EMAIL", "alerts@example.com")
+    monkeypatch.setenv("SENDGRID_API_HOST", sendgrid.url)
+    # 共用的 client、快取與來源在前面的測試可能已經建立，這裡換成指向替身的新實例
+    monkeypatch.setattr("fred_client._default_client", FredClient("test", fred.base_url))
+    monkeypatch.setattr("rate_sources._default_fetcher", None)
+    monkeypatch.setattr("rate_cache._default_cache", RateCache(tmp_path / "rate_cache.json"))
+    yield fred, sendgrid
+    fred.stop()
+    sendgrid.stop()
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for text in ("4/4", "-1/2", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shards_partition_subscribers(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_many((f"user{i}@example.com", 4.0, CONDITION_GTE, "DGS10") for i in range(1000))
+    counts = [store.count((i, 4)) for i in range(4)]
+    assert sum(counts) == 1000 and min(counts) > 150
+    with store.connect() as conn:
+        emails = [{row[0] for row in conn.execute("SELECT email FROM subscriptions WHERE 1" + shard_clause((i, 4)))}
+                  for i in range(4)]
+    assert not set.intersection(*emails[:2])
+
+
+def test_parallel_run_notifies_each_subscriber_once(env, tmp_path):
+    import monitor
+
+    fred, sendgrid = env
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_many((f"user{i}@example.com", 4.0, CONDITION_GTE, "DGS10") for i in range(300))
+
+    report = monitor.run_parallel(3, store=store)
+
+    assert report["ok"] and report["rules"] == 300
+    assert report["triggered"] == report["sent"] == 300
+    assert [r["shard"] for r in report["shards"]] == ["0/3", "1/3", "2/3"]
+    assert sendgrid.recipient_count == 300
+    # 利率只由協調者取得一次
+    assert fred.request_count <= 2
+
+
+def test_merge_marks_missing_shards_as_failed():
+    import monitor
+
+    def report(shard):
+        return {"shard": shard, "ok": True, "rules": 10, "triggered": 1, "sent": 1, "pending": 0,
+                "dead": 0, "seconds": 0.5}
+
+    merged = monitor.merge_reports([report("2/3"), report("0/3")], shards=3)
+    assert not merged["ok"] and merged["missing"] == ["1/3"]
+    assert merged["rules"] == 20
+
+    merged = monitor.merge_reports([report("0/2"), report("1/2")], shards=2)
+    assert merged["ok"] and merged["missing"] == []
+
+    merged = monitor.merge_reports([], shards=2)
+    assert not merged["ok"] and merged["missing"] == ["0/2", "1/2"]
@@ -0,0 +1,9 @@
+from benchmark import STARTUP_FORBIDDEN, all_imported
+
+
+def test_monitor_import_skips_heavy_dependencies():
+    assert not set(STARTUP_FORBIDDEN) & all_imported("import monitor")
+
+
+def test_sending_path_still_loads_email_sender():
+    assert "sendgrid" in all_imported("import monitor\nfrom email_sender import EmailSender")
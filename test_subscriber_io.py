@@ -0,0 +1,59 @@
+import io
+
+from subscriber_io import export_records, import_records, read_records
+from subscription_store import CONDITION_GTE, CONDITION_LTE, SubscriptionStore
+
+CSV = """email,target_rate,condition,series_id,locale
+a@example.com,4.5,greater than or equal to,DGS10,zh
+b@example.com,3.0,less than or equal to,DGS2,en
+a@example.com,4.5,greater than or equal to,DGS10,zh
+not-an-email,4.0,greater than or equal to,DGS10,zh
+c@example.com,abc,greater than or equal to,DGS10,zh
+c@example.com,4.0,sideways,DGS10,zh
+"""
+
+
+def test_import_counts_duplicates_and_invalid_rows(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add("b@example.com", 3.0, CONDITION_LTE, series_id="DGS2", locale="en")
+
+    stats = import_records(store, read_records(io.StringIO(CSV), "csv"), batch_size=2)
+
+    assert stats == {"read": 6, "imported": 1, "duplicates": 2, "invalid": 3}
+    assert store.count() == 2
+
+
+def test_export_round_trip(tmp_path):
+    source = SubscriptionStore(tmp_path / "source.db")
+    source.add_many((f"user{i}@example.com", 4.0 + i / 10, CONDITION_GTE, "DGS10") for i in range(25))
+    source.add_expression("rule@example.com", "DGS10 >= 4.5 and DGS2 < 4", locale="en")
+
+    for fmt in ("csv", "jsonl"):
+        exported = io.StringIO()
+        assert export_records(source, exported, fmt, batch_size=10) == 26
+        target = SubscriptionStore(tmp_path / f"target-{fmt}.db")
+        exported.seek(0)
+        stats = import_records(target, read_records(exported, fmt))
+        assert stats["imported"] == 26 and stats["invalid"] == 0
+        assert [row[1:6] for row in target.search(limit=100)] == [row[1:6] for row in source.search(limit=100)]
+
+
+def test_search_pages_with_keyset_cursor(tmp_path):
+    store = SubscriptionStore(tmp_path / "subscriptions.db")
+    store.add_many((f"user{i:02d}@example.com", 4.0, CONDITION_GTE, "DGS10" if i % 2 else "DGS2")
+                   for i in range(30))
+
+    pages, after_id = [], 0
+    while True:
+        page = store.search(series_id="DGS10", after_id=after_id, limit=4)
+        if not page:
+            break
+        pages.append(page)
+        after_id = page[-1][0]
+
+    emails = [row[1] for page in pages for row in page]
+    assert len(pages) == 4 and store.count_matching(series_id="DGS10") == 15
+    assert emails == [f"user{i:02d}@example.com" for i in range(1, 30, 2)]
+    assert [row[1] for row in store.search(email="user1", limit=100)] == [
+        f"user{i}@example.com" for i in range(10, 20)
+    ]
@@ -0,0 +1,104 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from subscription_store import CONDITION_GTE, CONDITION_LTE, SubscriptionStore, VersionConflictError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SubscriptionStore(tmp_path / "subscriptions.db")
+
+
+def _save_many(args):
+    path, worker, count = args
+    store = SubscriptionStore(path)
+    for i in range(count):
+        store.add(f"worker{worker}-{i}@example.com", 4.0, CONDITION_GTE)
+
+
+def _increment(store, subscription_id, times):
+    conflicts = 0
+    for _ in range(times):
+        while True:
+            current = store.get(subscription_id)
+            try:
+                store.update(subscription_id, current.version, target_rate=current.target_rate + 1)
+                break
+            except VersionConflictError:
+                conflicts += 1
+    return conflicts
+
+
+def test_concurrent_saves_from_threads(store):
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(_save_many, [(store.path, worker, 25) for worker in range(32)]))
+    elapsed = time.monotonic() - started
+
+    assert store.count() == 32 * 25
+    # 目標是每秒數百次儲存
+    assert 32 * 25 / elapsed >= 200
+
+
+def test_concurrent_saves_from_processes(store):
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        pool.map(_save_many, [(store.path, worker, 50) for worker in range(4)])
+
+    assert store.count() == 4 * 50
+
+
+def test_optimistic_updates_lose_nothing(store):
+    store.add("a@example.com", 0, CONDITION_GTE)
+    subscription_id = store.latest().id
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda _: _increment(store, subscription_id, 10), range(16)))
+
+    current = store.get(subscription_id)
+    assert current.target_rate == 160
+    assert current.version == 160
+
+
+def test_stale_version_is_rejected(store):
+    store.add("a@example.com", 4.0, CONDITION_GTE)
+    subscription = store.latest()
+    store.update(subscription.id, subscription.version, condition=CONDITION_LTE)
+
+    with pytest.raises(VersionConflictError):
+        store.update(subscription.id, subscription.version, target_rate=5.0)
+    assert store.get(subscription.id).condition == CONDITION_LTE
+
+
+def test_listed_subscriptions_carry_their_version(store):
+    store.add("a@example.com", 4.0, CONDITION_GTE)
+    subscription = store.latest()
+    store.update(subscription.id, subscription.version, target_rate=4.5)
+
+    latest = store.latest()
+    assert latest.version == 1
+    assert next(store.iter_sorted("DGS10", CONDITION_GTE)).version == 1
+    assert store.update(latest.id, latest.version, target_rate=5.0) == 2
+
+
+def test_legacy_config_json_is_migrated_once(store, tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text('{"email": "user@example.com", "target_rate": 4.0,'
+                      ' "condition": "greater than or equal to"}')
+    assert store.migrate_config_json(config)
+    assert not store.migrate_config_json(config)
+
+    latest = store.latest()
+    assert store.count() == 1
+    assert (latest.email, latest.target_rate, latest.condition, latest.series_id) == (
+        "user@example.com", 4.0, CONDITION_GTE, "DGS10")
+
+
+def test_legacy_config_without_email_is_skipped(store, tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text('{"email": "", "target_rate": 0.0, "condition": "greater than or equal to"}')
+    assert not store.migrate_config_json(config)
+    assert not store.migrate_config_json(tmp_path / "missing.json")
+    assert store.count() == 0